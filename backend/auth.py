@@ -1,15 +1,19 @@
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import bcrypt
 
 # Import shared DB and Models
-from database import get_db
+from database import get_async_db
 from models import User
+from query_cache import QueryCache
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
@@ -17,19 +21,35 @@ ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(
     os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440")
 )  # 24 hours
+# bcrypt work factor of new hashes; each step doubles the cost. Existing
+# hashes keep the factor they were created with.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads reserved for bcrypt, so a burst of logins queues there instead of
+# tying up the request threadpool shared with the catalog endpoints
+# (default: half the cores)
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))
+)
+# Hash/verify jobs allowed to wait for those threads before new ones get a 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Token subject -> Principal, so most authenticated requests skip the users
+# lookup. Each worker process has its own cache; the TTL bounds how long
+# another worker can serve an entry evicted here.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
 
 # Initialize Passlib context for bcrypt
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
     """
     Hashes a plain text password and returns a UTF-8 string.
     """
     # 1. Convert plain text to bytes
     pwd_bytes = password.encode("utf-8")
     # 2. Generate a salt and hash the password -- A salt is a random string of data
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     hashed_password_bytes = bcrypt.hashpw(pwd_bytes, salt)
     # 3. Decode the bytes to a string so SQLAlchemy can store it in a String() column
     return hashed_password_bytes.decode("utf-8")
@@ -51,6 +71,70 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL, so
+    the threads hash in parallel) and awaits it from the event loop. At most
+    `max_pending` jobs may be queued or running; beyond that the request is
+    rejected with a 503 instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS,
+    ):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_pending
+        self.rounds = rounds
+        # Only touched from the event loop, so no lock is needed
+        self.pending = 0
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins at once, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+
+password_hasher = PasswordHasher()
+
+
+class Principal:
+    """
+    The authenticated user as endpoints see it: plain attributes, not bound
+    to any session, so it can be cached across requests.
+    """
+
+    def __init__(self, id: int, email: str):
+        self.id = id
+        self.email = email
+
+
+principals = QueryCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(email: str):
+    """Drops a cached principal; call whenever a user's credentials change."""
+    principals.invalidate(email)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -61,9 +145,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-) -> User:
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Principal:
     """Get the current authenticated user from JWT token."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,7 +162,13 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = principals.get(email)
+    if principal is None:
+        # The session only checks out a connection on this cache miss
+        generation = principals.generation
+        user_id = await db.scalar(select(User.id).where(User.email == email))
+        if user_id is None:
+            raise credentials_exception
+        principal = Principal(user_id, email)
+        principals.put(email, principal, generation)
+    return principal
@@ -0,0 +1,620 @@
+"""
+End-to-end benchmark over synthetic catalogs: random 384-d embeddings in
+clusters, TMDB genres, release dates, ratings, popularity, titles and
+overviews, at 10k/100k (and optionally 1M) movies.
+
+Each catalog is written as a real snapshot (embedding store, vector index,
+neighbour table, search index, attribute columns) and cached on disk. The
+ranking stages behind ai-recommend, similar, search and genre-discovery
+are timed in-process, without a database. With --postgres the synthetic
+movies are also inserted into the database in DB_NAME and the endpoints
+are timed through the ASGI app.
+
+Prints p50/p95/p99 latency and throughput per endpoint and stage, and
+compares p95 with the stored baseline: a stage more than BENCH_TOLERANCE
+slower fails the run (exit code 1).
+
+Run from the backend folder:  python -m benchmarks.bench_catalog
+    --model          also time query encoding with the real encoder
+    --postgres       also time the HTTP endpoints; use a scratch database.
+                     Synthetic movies get ids from 2,000,000,000 and are
+                     deleted afterwards
+    --rebuild        regenerate the cached catalogs
+    --save-baseline  store these results as the new baseline
+
+BENCH_CATALOG_SIZES picks the sizes (e.g. 10000,100000,1000000; the
+million-movie catalog needs ~1.5 GB of disk for its embeddings).
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import platform
+import tempfile
+from datetime import date
+import numpy as np
+import orjson
+import httpx
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert
+from database import SessionLocal
+from models import Movie, MovieCategory, Genre, Favorite
+from embedding_store import StoreWriter
+from movie_attributes import MovieAttributes, MovieFilters
+from search_index import SearchIndex, reciprocal_rank_fusion
+from snapshots import SnapshotManager
+from response_cache import CachedBody, serialize_items, bump_catalog_version
+
+CATALOG_SIZES = [
+    int(size) for size in os.getenv("BENCH_CATALOG_SIZES", "10000,100000").split(",")
+]
+CATALOG_DIR = os.getenv(
+    "BENCH_CATALOG_DIR", os.path.join(tempfile.gettempdir(), "movie_bench_catalog")
+)
+BASELINE_PATH = os.getenv(
+    "BENCH_BASELINE", os.path.join(os.path.dirname(__file__), "baseline.json")
+)
+# Allowed p95 slowdown against the baseline before a stage counts as a regression
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+# Microsecond stages are noise-bound; smaller slowdowns never fail the run
+MIN_REGRESSION_MS = float(os.getenv("BENCH_MIN_REGRESSION_MS", "0.1"))
+# Timed calls per stage or endpoint, and concurrent requests per endpoint
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+
+SEED = 0
+DIM = 384
+CLUSTERS = 256
+CLUSTER_NOISE = 0.6
+# Movies generated and written at a time
+CHUNK_SIZE = 50_000
+# Above this, similar movies are scored live: precomputing a million-movie
+# neighbour table would dominate the setup time
+NEIGHBOR_TABLE_MAX_ROWS = 100_000
+# Synthetic movie ids start here so they never collide with real ones
+ID_OFFSET = 2_000_000_000
+VOCABULARY_SIZE = 5000
+WARMUP_CALLS = 20
+
+TMDB_GENRES = {
+    12: "Adventure",
+    14: "Fantasy",
+    16: "Animation",
+    18: "Drama",
+    27: "Horror",
+    28: "Action",
+    35: "Comedy",
+    36: "History",
+    37: "Western",
+    53: "Thriller",
+    80: "Crime",
+    99: "Documentary",
+    878: "Science Fiction",
+    9648: "Mystery",
+    10402: "Music",
+    10749: "Romance",
+    10751: "Family",
+    10752: "War",
+    10770: "TV Movie",
+}
+GENRE_IDS = np.array(sorted(TMDB_GENRES), dtype=np.int32)
+ATTRIBUTE_COLUMNS = (
+    "movie_ids",
+    "genre_bits",
+    "release_year",
+    "runtime",
+    "vote_average",
+    "popularity",
+)
+SYLLABLES = "ka lo mi ra ven tor sha el dun bri quo zar nel fi gor ath ish om".split()
+
+
+def make_vocabulary() -> np.ndarray:
+    rng = np.random.default_rng([SEED, 1])
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        length = rng.integers(2, 5)
+        words.add("".join(rng.choice(SYLLABLES, length)))
+    # Shuffled, so frequent words are not all alike
+    return rng.permutation(sorted(words))
+
+
+VOCABULARY = make_vocabulary()
+# Zipf-like word frequencies, as in real text
+WORD_WEIGHTS = 1 / np.arange(1, VOCABULARY_SIZE + 1)
+WORD_WEIGHTS /= WORD_WEIGHTS.sum()
+CENTROIDS = np.random.default_rng([SEED, 2]).standard_normal(
+    (CLUSTERS, DIM), dtype=np.float32
+)
+
+
+def genre_lists(genre_bits: np.ndarray) -> list:
+    return [
+        [int(gid) for bit, gid in enumerate(GENRE_IDS) if bits >> bit & 1]
+        for bits in genre_bits.tolist()
+    ]
+
+
+def movie_chunks(size: int, text: bool = False):
+    """
+    The synthetic catalog of `size` movies, CHUNK_SIZE at a time, always the
+    same for a given size. Titles and overviews only with `text`.
+    """
+    for start in range(0, size, CHUNK_SIZE):
+        count = min(CHUNK_SIZE, size - start)
+        rng = np.random.default_rng([SEED, size, start])
+
+        # Movies of a cluster are alike and share their main genre
+        cluster = rng.integers(CLUSTERS, size=count)
+        embeddings = CENTROIDS[cluster] + CLUSTER_NOISE * rng.standard_normal(
+            (count, DIM), dtype=np.float32
+        )
+        has_genre = rng.random((count, len(GENRE_IDS))) < 0.08
+        has_genre[np.arange(count), cluster % len(GENRE_IDS)] = True
+        genre_bits = (
+            has_genre.astype(np.uint64) << np.arange(len(GENRE_IDS), dtype=np.uint64)
+        ).sum(axis=1, dtype=np.uint64)
+
+        year = np.clip(2025 - rng.exponential(15, count), 1920, 2025).astype(np.int16)
+        runtime = np.clip(rng.normal(105, 20, count), 60, 240).astype(np.int16)
+        runtime[rng.random(count) < 0.03] = 0
+        vote_average = np.clip(rng.normal(6.3, 1.1, count), 0, 10).astype(np.float32)
+        vote_average[rng.random(count) < 0.05] = np.nan
+        popularity = rng.lognormal(1.5, 1.2, count).astype(np.float32)
+
+        chunk = {
+            "start": start,
+            "movie_ids": np.arange(start, start + count, dtype=np.int32) + ID_OFFSET,
+            "embeddings": embeddings,
+            "genre_bits": genre_bits,
+            "release_year": year,
+            "runtime": runtime,
+            "vote_average": vote_average,
+            "popularity": popularity,
+        }
+        if text:
+            text_rng = np.random.default_rng([SEED, size, start, 1])
+            words = VOCABULARY[
+                text_rng.choice(VOCABULARY_SIZE, (count, 28), p=WORD_WEIGHTS)
+            ]
+            title_lengths = text_rng.integers(1, 5, count)
+            overview_lengths = text_rng.integers(12, 25, count)
+            chunk["titles"] = [
+                " ".join(row[:length]).title()
+                for row, length in zip(words.tolist(), title_lengths.tolist())
+            ]
+            chunk["overviews"] = [
+                " ".join(row[4 : 4 + length])
+                for row, length in zip(words.tolist(), overview_lengths.tolist())
+            ]
+        yield chunk
+
+
+def build_catalog(manager: SnapshotManager, size: int):
+    """Writes the synthetic catalog of `size` movies as a published snapshot."""
+    print(f"Generating a synthetic catalog of {size} movies...")
+    version, directory = manager.new_directory()
+    writer = StoreWriter(directory, size)
+    columns = {}
+    for chunk in movie_chunks(size):
+        start = chunk["start"]
+        writer.write(slice(start, start + len(chunk["movie_ids"])), chunk["embeddings"])
+        for name in ATTRIBUTE_COLUMNS:
+            columns.setdefault(name, []).append(chunk[name])
+    columns = {name: np.concatenate(parts) for name, parts in columns.items()}
+    hashes = np.random.default_rng([SEED, size]).integers(
+        0, 2**63, size, dtype=np.uint64
+    )
+    store = writer.finish(columns["movie_ids"], hashes)
+
+    MovieAttributes(
+        GENRE_IDS,
+        columns["genre_bits"],
+        columns["release_year"],
+        columns["runtime"],
+        columns["vote_average"],
+        columns["popularity"],
+    ).save(directory)
+
+    def documents():
+        for chunk in movie_chunks(size, text=True):
+            genres = genre_lists(chunk["genre_bits"])
+            for movie_id, title, overview, movie_genres in zip(
+                chunk["movie_ids"].tolist(), chunk["titles"], chunk["overviews"], genres
+            ):
+                names = " ".join(TMDB_GENRES[gid] for gid in movie_genres)
+                yield movie_id, title, f"{names} {overview}"
+
+    SearchIndex.build(documents()).save(directory)
+
+    snapshot = manager.build(
+        version, directory, store, compute_neighbors=size <= NEIGHBOR_TABLE_MAX_ROWS
+    )
+    manager.publish(snapshot)
+    return snapshot
+
+
+def load_catalog(size: int, rebuild: bool):
+    """The (manager, snapshot) of the cached catalog, generated on first use."""
+    manager = SnapshotManager(os.path.join(CATALOG_DIR, str(size)))
+    snapshot = None if rebuild else manager.load_current()
+    if snapshot is None or snapshot.search is None or snapshot.attributes is None:
+        snapshot = build_catalog(manager, size)
+    else:
+        manager.current = snapshot
+        print(f"Using the cached catalog of {size} movies in {manager.root}")
+    return manager, snapshot
+
+
+def summarize(latencies_ms: list, elapsed: float = None) -> dict:
+    """Latency percentiles in ms and calls per second (sequential if no `elapsed`)."""
+    latencies = np.asarray(latencies_ms)
+    elapsed = elapsed if elapsed is not None else latencies.sum() / 1000
+    return {
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "throughput": float(len(latencies) / elapsed),
+    }
+
+
+def time_stage(call, inputs: list) -> dict:
+    """Times `call` once per input, after warming the mapped pages up."""
+    for value in inputs[:WARMUP_CALLS]:
+        call(value)
+    latencies = []
+    for value in inputs:
+        started = time.perf_counter()
+        call(value)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def make_workload(snapshot, size: int):
+    """
+    Seed rows, query vectors, text queries and filters for REQUESTS timed
+    calls, followed by WARMUP_CALLS more.
+    """
+    count = REQUESTS + WARMUP_CALLS
+    rng = np.random.default_rng([SEED, size, 3])
+    rows = rng.integers(size, size=count)
+
+    # Queries land near real movies, like a description of one
+    vectors = np.asarray(snapshot.store.embeddings[rows]) + 0.5 * rng.standard_normal(
+        (count, DIM), dtype=np.float32
+    ) / np.sqrt(DIM)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Half exact titles, half a few words with the last one half typed
+    texts = []
+    for i, row in enumerate(rows.tolist()):
+        if i % 2:
+            texts.append(snapshot.search.titles[row])
+        else:
+            words = VOCABULARY[rng.choice(VOCABULARY_SIZE, 3, p=WORD_WEIGHTS)]
+            texts.append(" ".join(words)[: -rng.integers(0, 3) or None])
+
+    # Genre, date, rating and runtime filters and a popularity blend in turn
+    filters = []
+    for i in range(count):
+        genre = [int(GENRE_IDS[i % len(GENRE_IDS)])]
+        choices = [
+            MovieFilters(genres=genre),
+            MovieFilters(year_from=2000, min_rating=7.0),
+            MovieFilters(genres=genre, max_runtime=120),
+            MovieFilters(min_rating=6.0, popularity_weight=0.3, rating_weight=0.2),
+        ]
+        filters.append(choices[i % len(choices)])
+    return rows.tolist(), list(vectors), texts, filters
+
+
+def genre_discovery_body(snapshot) -> CachedBody:
+    """The cached genre-discovery body the endpoint would build for the catalog."""
+    attributes = snapshot.attributes
+    popularity = np.nan_to_num(attributes.popularity)
+    rows = []
+    for bit, gid in enumerate(attributes.genre_ids.tolist()):
+        members = np.flatnonzero(attributes.genre_bits >> np.uint64(bit) & np.uint64(1))
+        top = members[np.argsort(-popularity[members])[:15]]
+        genres = genre_lists(attributes.genre_bits[top])
+        movies = [
+            {
+                "id": int(snapshot.store.movie_ids[row]),
+                "title": snapshot.search.titles[row],
+                "poster_path": f"/poster{row}.jpg",
+                "vote_average": float(np.nan_to_num(attributes.vote_average[row])),
+                "release_date": date(int(attributes.release_year[row]), 1, 1),
+                "genres": movie_genres,
+            }
+            for row, movie_genres in zip(top.tolist(), genres)
+        ]
+        rows.append({"genre_name": TMDB_GENRES[gid], "movies": movies})
+    return CachedBody(serialize_items(rows))
+
+
+def run_stages(snapshot, size: int, encoder=None) -> dict:
+    """Times the in-process stages of each endpoint on one catalog."""
+    rows, vectors, texts, filters = make_workload(snapshot, size)
+    store, index, attributes = snapshot.store, snapshot.index, snapshot.attributes
+
+    def filtered_search(i, k=20, skip=None):
+        exclude = attributes.exclude_mask(filters[i])
+        if skip is not None:
+            exclude[skip] = True
+        return index.search(
+            vectors[i], k, exclude=exclude, boost=attributes.boost(filters[i])
+        )
+
+    def similar_filtered(i):
+        row = rows[i]
+        exclude = attributes.exclude_mask(filters[i])
+        exclude[row] = True
+        boost = attributes.boost(filters[i])
+        return index.search(store.embeddings[row], 10, exclude=exclude, boost=boost)
+
+    def hybrid(i):
+        hits = snapshot.search.search(texts[i], 50)
+        semantic, _ = index.search(vectors[i], 50)
+        return reciprocal_rank_fusion([hits.movie_ids, store.ids_at(semantic)])
+
+    discovery = genre_discovery_body(snapshot).items()
+
+    calls = list(range(REQUESTS))
+    stages = {}
+    if encoder is not None:
+        stages["ai-recommend/encode"] = lambda i: encoder.encode([texts[i]])
+    stages.update(
+        {
+            "ai-recommend/vector search": lambda i: index.search(vectors[i], 50),
+            "ai-recommend/filter mask": lambda i: attributes.exclude_mask(filters[i]),
+            "ai-recommend/filtered search": filtered_search,
+            "similar/neighbors": lambda i: snapshot.similar_rows(rows[i], 10),
+            "similar/filtered": similar_filtered,
+            "search/lexical": lambda i: snapshot.search.search(texts[i], 50),
+            "search/hybrid": hybrid,
+            "genre-discovery/cached response": lambda i: b"["
+            + b",".join(random.sample(discovery, 3))
+            + b"]",
+        }
+    )
+    return {f"{size}/{name}": time_stage(call, calls) for name, call in stages.items()}
+
+
+def movie_rows(chunk) -> list:
+    """Insert parameters for the movies of a chunk."""
+    genres = genre_lists(chunk["genre_bits"])
+    popularity = chunk["popularity"].tolist()
+    vote_average = chunk["vote_average"].tolist()
+    release_year = chunk["release_year"].tolist()
+    runtime = chunk["runtime"].tolist()
+    return [
+        {
+            "id": movie_id,
+            # tmdb_id is unique; synthetic movies count down from -1
+            "tmdb_id": ID_OFFSET - 1 - movie_id,
+            "title": chunk["titles"][i],
+            "overview": chunk["overviews"][i],
+            "genres": genres[i],
+            "poster_path": f"/poster{movie_id}.jpg",
+            "popularity": popularity[i],
+            "vote_average": None if np.isnan(vote_average[i]) else vote_average[i],
+            "vote_count": 100,
+            "release_date": date(release_year[i], 1 + movie_id % 12, 1),
+            "runtime": runtime[i] or None,
+        }
+        for i, movie_id in enumerate(chunk["movie_ids"].tolist())
+    ]
+
+
+def remove_synthetic_movies(db):
+    db.execute(delete(Favorite).where(Favorite.movie_id >= ID_OFFSET))
+    db.execute(delete(MovieCategory).where(MovieCategory.movie_id >= ID_OFFSET))
+    db.execute(delete(Movie).where(Movie.id >= ID_OFFSET))
+    db.commit()
+
+
+def seed_database(db, size: int):
+    """Replaces the synthetic movies in the database with the catalog of `size`."""
+    print(f"Inserting {size} synthetic movies into the database...")
+    remove_synthetic_movies(db)
+    db.execute(
+        insert(Genre)
+        .values([{"id": gid, "name": name} for gid, name in TMDB_GENRES.items()])
+        .on_conflict_do_nothing()
+    )
+    for chunk in movie_chunks(size, text=True):
+        db.execute(insert(Movie), movie_rows(chunk))
+    db.commit()
+    # Fresh planner statistics for the new rows
+    db.execute(text("ANALYZE movies"))
+    bump_catalog_version(db)
+
+
+def filter_params(filters: MovieFilters) -> dict:
+    params = {"genres": filters.genres} if filters.genres else {}
+    for name in (
+        "year_from",
+        "year_to",
+        "max_runtime",
+        "min_rating",
+        "popularity_weight",
+        "rating_weight",
+    ):
+        if getattr(filters, name):
+            params[name] = getattr(filters, name)
+    return params
+
+
+async def time_endpoint(client, requests: list, concurrency: int, before=None):
+    """
+    Sends (path, params) requests, `concurrency` at a time; the first
+    WARMUP_CALLS only warm up. `before` runs ahead of each timed request.
+    """
+    for path, params in requests[REQUESTS:]:
+        await client.get(path, params=params)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(path, params):
+        async with semaphore:
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (path, response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(path, params) for path, params in requests[:REQUESTS]))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_endpoints(manager: SnapshotManager, snapshot, size: int) -> dict:
+    """Times the endpoints through the ASGI app against the seeded database."""
+    # Loads the encoder and the app; only needed for this part
+    import main
+
+    rows, _, texts, filters = make_workload(snapshot, size)
+    movie_ids = snapshot.store.ids_at(rows)
+    db = SessionLocal()
+    try:
+        seed_database(db, size)
+        # Serve the synthetic snapshot instead of the real one
+        main.snapshots = manager
+        main.publish_snapshot(snapshot)
+        main.response_cache.local.clear()
+        await main.query_batcher.start()
+
+        ranked = [("/movies/ai-recommend", {"query": text}) for text in texts]
+        # Same texts, so these re-search cached query vectors under filters
+        ranked_filtered = [
+            (path, {**params, **filter_params(f)})
+            for (path, params), f in zip(ranked, filters)
+        ]
+        similar = [(f"/movies/similar/{mid}", {"limit": 10}) for mid in movie_ids]
+        similar_filtered = [
+            (path, {**params, **filter_params(f)})
+            for (path, params), f in zip(similar, filters)
+        ]
+        search = [("/movies/search", {"query": text}) for text in texts]
+        discovery = [("/movies/genre-discovery", {})] * len(texts)
+
+        scenarios = [
+            ("ai-recommend/http", ranked, CONCURRENCY, None),
+            ("ai-recommend/http filtered", ranked_filtered, CONCURRENCY, None),
+            ("similar/http", similar, CONCURRENCY, None),
+            ("similar/http filtered", similar_filtered, CONCURRENCY, None),
+            ("search/http", search, CONCURRENCY, None),
+            ("genre-discovery/http", discovery, CONCURRENCY, None),
+            # One at a time, each running the lateral query again
+            (
+                "genre-discovery/http uncached",
+                discovery,
+                1,
+                main.response_cache.local.clear,
+            ),
+        ]
+        results = {}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for name, requests, concurrency, before in scenarios:
+                results[f"{size}/{name}"] = await time_endpoint(
+                    client, requests, concurrency, before
+                )
+        await main.query_batcher.stop()
+        return results
+    finally:
+        remove_synthetic_movies(db)
+        bump_catalog_version(db)
+        db.close()
+
+
+def machine() -> dict:
+    return {"platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        print(f"No baseline at {BASELINE_PATH}; store one with --save-baseline")
+        return {}
+    with open(BASELINE_PATH, "rb") as f:
+        baseline = orjson.loads(f.read())
+    if baseline.get("machine") != machine():
+        print(f"Baseline was recorded on {baseline.get('machine')}, not {machine()}")
+    return baseline.get("results", {})
+
+
+def save_baseline(results: dict):
+    tmp_path = f"{BASELINE_PATH}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            orjson.dumps(
+                {"machine": machine(), "results": results},
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS,
+            )
+        )
+    os.replace(tmp_path, BASELINE_PATH)
+    print(f"Baseline saved to {BASELINE_PATH}")
+
+
+def report(results: dict, baseline: dict) -> int:
+    """Prints every stage next to its baseline; returns the number of regressions."""
+    print(
+        f"\n{'catalog/endpoint/stage':<44} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'per s':>9} {'base p95':>9} {'change':>7}"
+    )
+    regressions = 0
+    for key, stats in results.items():
+        line = (
+            f"{key:<44} {stats['p50']:>9.3f} {stats['p95']:>9.3f} "
+            f"{stats['p99']:>9.3f} {stats['throughput']:>9.1f}"
+        )
+        base = baseline.get(key)
+        if base is not None:
+            change = stats["p95"] / base["p95"] - 1
+            regressed = (
+                change > TOLERANCE and stats["p95"] - base["p95"] > MIN_REGRESSION_MS
+            )
+            line += f" {base['p95']:>9.3f} {change:>+7.0%}"
+            if regressed:
+                line += "  REGRESSION"
+                regressions += 1
+        print(line)
+    return regressions
+
+
+async def run() -> dict:
+    encoder = None
+    if "--model" in sys.argv:
+        from encoders import load_encoder
+
+        encoder = load_encoder()
+
+    results = {}
+    for size in CATALOG_SIZES:
+        manager, snapshot = load_catalog(size, rebuild="--rebuild" in sys.argv)
+        results.update(run_stages(snapshot, size, encoder))
+        if "--postgres" in sys.argv:
+            results.update(await run_endpoints(manager, snapshot, size))
+    return results
+
+
+def main():
+    results = asyncio.run(run())
+    regressions = report(results, load_baseline())
+    if "--save-baseline" in sys.argv:
+        save_baseline(results)
+    elif regressions:
+        sys.exit(
+            f"{regressions} stages are more than {TOLERANCE:.0%} slower at p95 "
+            "than the baseline"
+        )
+
+
+if __name__ == "__main__":
+    main()
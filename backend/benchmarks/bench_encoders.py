@@ -0,0 +1,72 @@
+"""
+Parity check and latency benchmark: ONNX encoder vs. the PyTorch reference.
+
+Exits non-zero when the ONNX embeddings drift from the PyTorch ones, so it
+can gate a switch of ENCODER_BACKEND.
+
+Run from the backend folder:  python -m benchmarks.bench_encoders
+"""
+
+import sys
+import time
+import numpy as np
+from encoders import SentenceTransformerEncoder, OnnxEncoder
+
+QUERIES = [
+    "feel-good comedy",
+    "dark thriller",
+    "mind-bending sci-fi from the 90s",
+    "a heartwarming animated movie for the whole family",
+    "slow burn horror set in a remote cabin",
+    "epic space opera with huge battles",
+    "romantic drama that will make me cry",
+    "gritty crime story about a heist gone wrong",
+    "documentary about nature and wildlife",
+    "superhero origin story",
+    "Title: Inception. Genres: Action Science Fiction Adventure. Overview: "
+    "Cobb, a skilled thief who commits corporate espionage by infiltrating "
+    "the subconscious of his targets, is offered a chance at redemption.",
+]
+# Minimum cosine between the two backends' vectors for the same text
+MIN_COSINE = 0.98
+ROUNDS = 50
+
+
+def latency_ms(encoder, texts):
+    encoder.encode(texts[:1])  # warm-up
+    timings = []
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        encoder.encode([texts[i % len(texts)]])
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, [50, 99])
+
+
+def run():
+    reference = SentenceTransformerEncoder()
+    failed = False
+    for precision in ("fp32", "int8"):
+        candidate = OnnxEncoder(precision=precision)
+
+        cosines = np.sum(reference.encode(QUERIES) * candidate.encode(QUERIES), axis=1)
+        ok = cosines.min() >= MIN_COSINE
+        failed |= not ok
+        print(
+            f"onnx-{precision}: cosine min {cosines.min():.4f} "
+            f"mean {cosines.mean():.4f} -> {'OK' if ok else 'FAIL'}"
+        )
+
+    print(f"\n{'backend':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, encoder in (
+        ("torch", reference),
+        ("onnx-fp32", OnnxEncoder(precision="fp32")),
+        ("onnx-int8", OnnxEncoder(precision="int8")),
+    ):
+        p50, p99 = latency_ms(encoder, QUERIES)
+        print(f"{name:>10} {p50:>8.2f} {p99:>8.2f}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
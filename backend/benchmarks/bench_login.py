@@ -0,0 +1,96 @@
+"""
+Login benchmark: a burst of logins through the old path (bcrypt inside a
+sync endpoint, on the request threadpool every sync endpoint shares) and
+the new one (auth.PasswordHasher on its own bounded pool). Reports login
+throughput, and the latency of a sync endpoint called during the burst.
+
+Runs the endpoints in-process; no database is needed.
+
+Run from the backend folder:  python -m benchmarks.bench_login
+BENCH_BCRYPT_ROUNDS sets the cost of the benchmark hash (production uses
+auth.BCRYPT_ROUNDS).
+"""
+
+import os
+import time
+import asyncio
+import numpy as np
+import httpx
+from fastapi import FastAPI
+import auth
+
+BURST_LOGINS = 64
+PROBE_INTERVAL_SECONDS = 0.01
+ROUNDS = int(os.getenv("BENCH_BCRYPT_ROUNDS", "10"))
+PASSWORD = "correct horse battery staple"
+
+
+def make_app(hasher: auth.PasswordHasher) -> FastAPI:
+    app = FastAPI()
+    stored = auth.hash_password(PASSWORD, ROUNDS)
+
+    @app.post("/login/threadpool")
+    def login_threadpool():
+        return {"ok": auth.verify_password(PASSWORD, stored)}
+
+    @app.post("/login/executor")
+    async def login_executor():
+        return {"ok": await hasher.verify(PASSWORD, stored)}
+
+    # Stands in for any sync endpoint (forgot-password, rebuild status, ...)
+    @app.get("/probe")
+    def probe():
+        return {}
+
+    return app
+
+
+async def run_burst(client: httpx.AsyncClient, path: str):
+    """(logins per second, probe latencies in ms) for one burst."""
+    done = asyncio.Event()
+    latencies = []
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/probe")
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+
+    prober = asyncio.create_task(probe())
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.post(path) for _ in range(BURST_LOGINS)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await prober
+    assert all(r.status_code == 200 for r in responses)
+    return BURST_LOGINS / elapsed, np.array(latencies)
+
+
+async def main():
+    hasher = auth.PasswordHasher(max_pending=BURST_LOGINS, rounds=ROUNDS)
+    app = make_app(hasher)
+    transport = httpx.ASGITransport(app=app)
+
+    started = time.perf_counter()
+    auth.hash_password(PASSWORD, ROUNDS)
+    hash_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"bcrypt cost {ROUNDS}: {hash_ms:.0f} ms per hash, "
+        f"{os.cpu_count()} cores, {hasher.workers} bcrypt threads"
+    )
+    print(f"{'path':>12} {'logins/s':>9} {'probe p50 ms':>13} {'probe p95 ms':>13}")
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for name in ("threadpool", "executor"):
+            rate, latencies = await run_burst(client, f"/login/{name}")
+            print(
+                f"{name:>12} {rate:>9.1f} {np.percentile(latencies, 50):>13.2f} "
+                f"{np.percentile(latencies, 95):>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+"""
+Micro-benchmark: full argsort vs. argpartition top-k over a similarity vector.
+
+Run from the backend folder:  python -m benchmarks.bench_top_k
+"""
+
+import timeit
+import numpy as np
+from ranking import top_k
+
+SIZES = [10_000, 100_000, 1_000_000]
+K_VALUES = [10, 50]
+REPEATS = 20
+
+
+def argsort_top_k(scores, k, exclude):
+    # The ranking code before ranking.top_k existed
+    order = np.argsort(scores)[::-1][: k + len(exclude)]
+    return order[~np.isin(order, exclude)][:k]
+
+
+def run():
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'k':>4} {'argsort ms':>12} {'top_k ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        scores = rng.random(size, dtype=np.float32)
+        exclude = [0]
+        for k in K_VALUES:
+            expected = argsort_top_k(scores, k, exclude)
+            assert np.array_equal(top_k(scores, k, exclude), expected)
+
+            full = timeit.timeit(
+                lambda: argsort_top_k(scores, k, exclude), number=REPEATS
+            )
+            partial = timeit.timeit(lambda: top_k(scores, k, exclude), number=REPEATS)
+            print(
+                f"{size:>10} {k:>4} {full / REPEATS * 1000:>12.3f} "
+                f"{partial / REPEATS * 1000:>10.3f} {full / partial:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the TMDB API, for exercising the ingestion scripts
+without an API key or TMDB's rate limit.
+
+Run from the backend folder:
+    uvicorn benchmarks.fake_tmdb:app --port 8001
+    TMDB_BASE_URL=http://127.0.0.1:8001/3 python -m scripts.ingest
+
+FAKE_TMDB_LATENCY_MS adds a delay to every response and
+FAKE_TMDB_ERROR_RATE answers that fraction of requests with a 429.
+Responses carry an ETag and honour If-None-Match, like TMDB's.
+"""
+
+import os
+import random
+import asyncio
+import hashlib
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+LATENCY_MS = float(os.getenv("FAKE_TMDB_LATENCY_MS", "50"))
+ERROR_RATE = float(os.getenv("FAKE_TMDB_ERROR_RATE", "0"))
+TOTAL_PAGES = int(os.getenv("FAKE_TMDB_PAGES", "500"))
+PAGE_SIZE = 20
+GENRES = {28: "Action", 12: "Adventure", 35: "Comedy", 18: "Drama", 878: "Sci-Fi"}
+# Distinct id ranges, with some overlap so movies appear in several lists
+CATEGORY_OFFSETS = {
+    "now_playing": 0,
+    "popular": 100,
+    "top_rated": 2_000,
+    "upcoming": 50,
+}
+
+app = FastAPI()
+
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+def fake_movie(tmdb_id: int) -> dict:
+    rng = random.Random(tmdb_id)
+    return {
+        "id": tmdb_id,
+        "title": f"Movie {tmdb_id}",
+        "overview": f"Overview of movie {tmdb_id}. " * rng.randint(1, 8),
+        "genre_ids": rng.sample(sorted(GENRES), rng.randint(1, 3)),
+        "poster_path": f"/poster{tmdb_id}.jpg",
+        "backdrop_path": f"/backdrop{tmdb_id}.jpg",
+        "popularity": round(rng.uniform(1, 1000), 3),
+        "vote_average": round(rng.uniform(1, 10), 1),
+        "vote_count": rng.randint(0, 20_000),
+        "release_date": f"{rng.randint(1950, 2025)}-{rng.randint(1, 12):02d}-01",
+    }
+
+
+async def simulate_network():
+    await asyncio.sleep(LATENCY_MS / 1000)
+    if random.random() < ERROR_RATE:
+        raise HTTPException(
+            status_code=429, detail="Rate limited", headers={"Retry-After": "1"}
+        )
+
+
+@app.get("/3/genre/movie/list")
+async def genre_list():
+    await simulate_network()
+    return {"genres": [{"id": gid, "name": name} for gid, name in GENRES.items()]}
+
+
+def fake_videos(tmdb_id: int) -> dict:
+    # Every fifth movie has no trailer
+    results = []
+    if tmdb_id % 5:
+        results.append({"key": f"yt{tmdb_id}", "site": "YouTube", "type": "Trailer"})
+    return {"results": results}
+
+
+@app.get("/3/movie/{tmdb_id:int}")
+async def movie_details(tmdb_id: int, append_to_response: str = ""):
+    await simulate_network()
+    if tmdb_id <= 0:
+        raise HTTPException(status_code=404, detail="Not found")
+    details = {**fake_movie(tmdb_id), "runtime": 80 + tmdb_id % 90}
+    if "videos" in append_to_response.split(","):
+        details["videos"] = fake_videos(tmdb_id)
+    return details
+
+
+@app.get("/3/movie/{tmdb_id:int}/videos")
+async def movie_videos(tmdb_id: int):
+    await simulate_network()
+    return {"id": tmdb_id, **fake_videos(tmdb_id)}
+
+
+@app.get("/3/movie/{category}")
+async def movie_list(category: str, page: int = 1):
+    await simulate_network()
+    if category not in CATEGORY_OFFSETS:
+        raise HTTPException(status_code=404, detail="Not found")
+    if page > TOTAL_PAGES:
+        return JSONResponse(status_code=400, content={"errors": ["page too large"]})
+
+    first_id = CATEGORY_OFFSETS[category] + (page - 1) * PAGE_SIZE + 1
+    return {
+        "page": page,
+        "total_pages": TOTAL_PAGES,
+        "results": [fake_movie(i) for i in range(first_id, first_id + PAGE_SIZE)],
+    }
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Date, JSON
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import urllib.parse  # parser to handle the special characters
 from pathlib import Path
 
@@ -18,6 +19,26 @@ DB_PASS = os.getenv("DB_PASS")
 
 encoded_password = urllib.parse.quote_plus(DB_PASS)
 
+# Connection pool tuning, shared by the sync and async engines
+# (each engine has its own pool, so a worker can hold up to 2 x (size + overflow))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which a pooled connection is replaced
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Prepared statements asyncpg caches per connection (0 disables, e.g. behind pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+POOL_SETTINGS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
 
 def get_db():
     db = SessionLocal()
@@ -27,8 +48,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 DATABASE_URL = f"postgresql://{DB_USER}:{encoded_password}@{DB_HOST}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **POOL_SETTINGS)
 
 SessionLocal = sessionmaker(bind=engine)
+
+# Async engine on asyncpg for the endpoints that do not need the sync session
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{encoded_password}@{DB_HOST}/{DB_NAME}"
+)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    **POOL_SETTINGS,
+)
+# Objects stay readable after commit, since the response is built afterwards
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 Base = declarative_base()
@@ -0,0 +1,268 @@
+import os
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from models import Movie, Genre
+from embedding_store import EmbeddingStore, StoreWriter
+
+# Movies encoded per model.encode call; also the progress reporting granularity
+ENCODE_CHUNK_SIZE = 256
+# Movies fetched per round trip while streaming the table (server-side cursor)
+MOVIE_STREAM_CHUNK_SIZE = int(os.getenv("MOVIE_STREAM_CHUNK_SIZE", "2000"))
+# Encoder processes for builds: 0 encodes in-process with the serving model,
+# "auto" starts one per core. Each process loads its own copy of the model.
+EMBED_WORKERS = os.getenv("EMBED_WORKERS", "0")
+
+
+def build_movie_text(title: str, genre_ids, overview: str, genre_map: dict) -> str:
+    """The natural language description the model "reads" for a movie."""
+    genre_names = " ".join([genre_map.get(gid, "") for gid in (genre_ids or [])])
+    return f"Title: {title}. Genres: {genre_names}. Overview: {overview or ''}"
+
+
+def stream_movies(db: Session, *columns, limit: int = None):
+    """
+    `columns` of every movie in id order, fetched MOVIE_STREAM_CHUNK_SIZE rows
+    at a time so builds never hold the whole table.
+    """
+    stmt = select(*columns).order_by(Movie.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.execute(stmt.execution_options(yield_per=MOVIE_STREAM_CHUNK_SIZE))
+
+
+def content_hash(text: str) -> int:
+    """64-bit fingerprint of a movie text; a changed hash means re-encode."""
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def encode_workers(setting: str = EMBED_WORKERS) -> int:
+    """Number of encoder processes for an EMBED_WORKERS value."""
+    if setting == "auto":
+        return os.cpu_count() or 1
+    return int(setting)
+
+
+# The encoder of a pool process, loaded once by _init_encode_worker
+_worker_encoder = None
+
+
+def _init_encode_worker(backend: str, threads: int):
+    # Split the cores between the processes instead of each one taking all
+    # of them; set before the encoder imports torch / ONNX Runtime
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["ONNX_THREADS"] = str(threads)
+    from encoders import load_encoder
+
+    global _worker_encoder
+    _worker_encoder = load_encoder(backend)
+
+
+def _encode_in_worker(texts: list) -> np.ndarray:
+    return _worker_encoder.encode(texts)
+
+
+class EncodeQueue:
+    """
+    Encodes chunks of movie texts and passes the vectors to
+    `write(rows, vectors)`. With more than one worker the chunks go to a pool
+    of encoder processes, at most two per process in flight so finished
+    vectors never pile up; otherwise they are encoded inline with `encoder`.
+    """
+
+    def __init__(self, encoder, workers: int, write):
+        self.encoder = encoder
+        self.write = write
+        self.pool = None
+        self.in_flight = deque()
+        self.max_in_flight = 2 * workers
+        if workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                # A fresh interpreter, not a fork of a process holding model
+                # threads and database connections
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_encode_worker,
+                initargs=(encoder.backend, threads),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def submit(self, rows: np.ndarray, texts: list):
+        if self.pool is None:
+            self.write(rows, self.encoder.encode(texts))
+            return
+        if len(self.in_flight) >= self.max_in_flight:
+            self._collect()
+        self.in_flight.append((rows, self.pool.submit(_encode_in_worker, texts)))
+
+    def _collect(self):
+        rows, future = self.in_flight.popleft()
+        self.write(rows, future.result())
+
+    def flush(self):
+        while self.in_flight:
+            self._collect()
+
+
+def rebuild_store(
+    db: Session,
+    encoder,
+    directory: str,
+    previous: EmbeddingStore = None,
+    progress=None,
+    full=False,
+    workers: int = None,
+):
+    """
+    Writes a store into `directory` that matches the movies table.
+
+    Movies whose text hash matches a row of `previous` keep that vector; new or
+    changed movies are encoded, and movies that no longer exist are dropped,
+    so the rows of the new store are compact. `full=True` re-encodes everything.
+
+    Only id, title, genres and overview are streamed from the database, and
+    vectors go straight into a memory-mapped matrix, so memory stays bounded
+    by the chunk sizes rather than the catalog size.
+
+    Returns None when the movies table is empty, with nothing written.
+    """
+    genre_map = {g.id: g.name for g in db.query(Genre).all()}
+    # Movies added while streaming wait for the next build
+    total = db.scalar(select(func.count()).select_from(Movie))
+    if progress is not None:
+        progress.begin(total=total)
+
+    reuse = (
+        previous is not None
+        and previous.hashes is not None
+        and len(previous) > 0
+        and not full
+    )
+    writer = StoreWriter(directory, total)
+    movie_ids = np.empty(total, dtype=np.int32)
+    hashes = np.empty(total, dtype=np.uint64)
+    count = 0
+
+    def write_encoded(rows, vectors):
+        writer.write(rows, vectors)
+        if progress is not None:
+            progress.advance(encoded=len(rows))
+
+    stream = stream_movies(
+        db, Movie.id, Movie.title, Movie.genres, Movie.overview, limit=total
+    )
+    workers = encode_workers() if workers is None else workers
+    with EncodeQueue(encoder, workers, write_encoded) as queue:
+        pending_rows, pending_texts = [], []
+        for partition in stream.partitions():
+            start, count = count, count + len(partition)
+            texts = [
+                build_movie_text(row.title, row.genres, row.overview, genre_map)
+                for row in partition
+            ]
+            chunk_ids = np.array([row.id for row in partition], dtype=np.int32)
+            chunk_hashes = np.array([content_hash(t) for t in texts], dtype=np.uint64)
+            movie_ids[start:count] = chunk_ids
+            hashes[start:count] = chunk_hashes
+
+            # Row of each movie in the previous store, or -1 to encode it
+            old_rows = np.full(len(partition), -1, dtype=np.int64)
+            if reuse:
+                old_rows = previous.rows_of(chunk_ids)
+                unchanged = previous.hashes[np.maximum(old_rows, 0)] == chunk_hashes
+                old_rows[~unchanged] = -1
+
+            reused = np.flatnonzero(old_rows >= 0)
+            if len(reused):
+                writer.write(start + reused, previous.embeddings[old_rows[reused]])
+                if progress is not None:
+                    progress.advance(reused=len(reused))
+
+            for i in np.flatnonzero(old_rows < 0):
+                pending_rows.append(start + i)
+                pending_texts.append(texts[i])
+            while len(pending_rows) >= ENCODE_CHUNK_SIZE:
+                queue.submit(
+                    np.array(pending_rows[:ENCODE_CHUNK_SIZE]),
+                    pending_texts[:ENCODE_CHUNK_SIZE],
+                )
+                del pending_rows[:ENCODE_CHUNK_SIZE], pending_texts[:ENCODE_CHUNK_SIZE]
+
+        if pending_rows:
+            queue.submit(np.array(pending_rows), pending_texts)
+        queue.flush()
+
+    if count == 0:
+        return None
+    movie_ids, hashes = movie_ids[:count], hashes[:count]
+    if progress is not None and previous is not None:
+        removed = int(np.count_nonzero(~np.isin(previous.movie_ids, movie_ids)))
+        progress.update(removed=removed)
+    return writer.finish(movie_ids, hashes)
+
+
+class RebuildJob:
+    """
+    Runs one embedding rebuild at a time on a background thread and keeps its
+    progress for the status endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = {"status": "idle"}
+
+    def start(self, run) -> bool:
+        """Starts `run(job)` in the background; False if a rebuild is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._state = {
+                "status": "running",
+                "started_at": datetime.now().isoformat(),
+            }
+            self._thread = threading.Thread(target=self._run, args=(run,), daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, run):
+        try:
+            run(self)
+            self.update(status="completed")
+        except Exception as e:
+            traceback.print_exc()
+            self.update(status="failed", error=str(e))
+        finally:
+            self.update(finished_at=datetime.now().isoformat())
+
+    def update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    def begin(self, total: int):
+        self.update(stage="encoding", total=total, encoded=0, reused=0, removed=0)
+
+    def advance(self, encoded: int = 0, reused: int = 0):
+        with self._lock:
+            self._state["encoded"] = self._state.get("encoded", 0) + encoded
+            self._state["reused"] = self._state.get("reused", 0) + reused
+
+    def status(self) -> dict:
+        with self._lock:
+            return dict(self._state)
@@ -0,0 +1,178 @@
+import os
+import pickle
+import numpy as np
+from vector_index import normalize_rows
+
+# File names inside a snapshot directory (see snapshots.py)
+EMBEDDINGS_FILE = "movie_embeddings.npy"
+MOVIE_IDS_FILE = "movie_ids.npy"
+# Content hash of the text each row was encoded from (see embedding_builder)
+MOVIE_HASHES_FILE = "movie_hashes.npy"
+LEGACY_CACHE_PATH = "movie_embeddings.pkl"
+
+
+class EmbeddingStore:
+    """
+    Read-only view over the on-disk embedding matrix.
+
+    Rows are L2-normalized float32, so a dot product is the cosine similarity.
+    `movie_ids[row]` gives the movie of a row; the reverse lookup is a binary
+    search over a sorted copy of the ids instead of a dict of boxed ints.
+    """
+
+    def __init__(self, embeddings: np.ndarray, movie_ids: np.ndarray, hashes=None):
+        self.embeddings = embeddings
+        self.movie_ids = movie_ids
+        self.hashes = hashes
+        self._order = np.argsort(movie_ids, kind="stable").astype(np.int32)
+        self._sorted_ids = movie_ids[self._order]
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def __contains__(self, movie_id: int) -> bool:
+        return self.index_of(movie_id) is not None
+
+    def index_of(self, movie_id: int):
+        """Row of a movie in the matrix, or None if it has no embedding."""
+        pos = np.searchsorted(self._sorted_ids, movie_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == movie_id:
+            return int(self._order[pos])
+        return None
+
+    def rows_of(self, movie_ids) -> np.ndarray:
+        """Vectorized index_of: the row of each movie id, -1 where it has none."""
+        movie_ids = np.asarray(movie_ids)
+        if len(self._sorted_ids) == 0:
+            return np.full(len(movie_ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_ids, movie_ids)
+        pos = np.minimum(pos, len(self._sorted_ids) - 1)
+        rows = self._order[pos].astype(np.int64)
+        rows[self._sorted_ids[pos] != movie_ids] = -1
+        return rows
+
+    def ids_at(self, rows) -> list:
+        """Movie ids for a sequence of rows, as plain ints for SQL IN lists."""
+        return self.movie_ids[np.asarray(rows, dtype=np.int64)].tolist()
+
+
+def _save_array(path: str, array: np.ndarray):
+    # Write to a temp file first so a crash never leaves a truncated cache behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_store(
+    directory: str, embeddings: np.ndarray, movie_ids, hashes=None
+) -> EmbeddingStore:
+    """
+    Normalizes and writes the embedding matrix, id array and optional content
+    hashes into `directory`, then maps them back.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _save_array(os.path.join(directory, EMBEDDINGS_FILE), normalize_rows(embeddings))
+    ids_path = os.path.join(directory, MOVIE_IDS_FILE)
+    _save_array(ids_path, np.asarray(movie_ids, dtype=np.int32))
+    if hashes is not None:
+        hashes_path = os.path.join(directory, MOVIE_HASHES_FILE)
+        _save_array(hashes_path, np.asarray(hashes, dtype=np.uint64))
+    return load_store(directory)
+
+
+class StoreWriter:
+    """
+    Fills the matrix of a new store in `directory` block by block through a
+    memory-mapped .npy, so a build never holds the whole matrix in RAM.
+    The matrix is sized for `rows` movies; its width comes from the first write.
+    """
+
+    # Rows copied at a time when the finished matrix has to be trimmed
+    TRIM_CHUNK_ROWS = 8192
+
+    def __init__(self, directory: str, rows: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = rows
+        self.path = os.path.join(directory, EMBEDDINGS_FILE)
+        self.embeddings = None
+
+    def _open(self, path: str, rows: int, width: int) -> np.ndarray:
+        return np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=(rows, width)
+        )
+
+    def write(self, rows, vectors: np.ndarray):
+        """Normalizes `vectors` into the given matrix rows."""
+        if self.embeddings is None:
+            self.embeddings = self._open(
+                f"{self.path}.tmp", self.rows, vectors.shape[1]
+            )
+        self.embeddings[rows] = normalize_rows(vectors)
+
+    def finish(self, movie_ids: np.ndarray, hashes: np.ndarray) -> EmbeddingStore:
+        """
+        Publishes the matrix with its ids and hashes, then maps it back. Rows
+        past len(movie_ids) (movies deleted during the build) are dropped.
+        """
+        if self.embeddings is None:
+            raise RuntimeError("No movies to embed")
+        tmp_path = f"{self.path}.tmp"
+        self.embeddings.flush()
+
+        count = len(movie_ids)
+        if count < self.rows:
+            trimmed = self._open(f"{self.path}.trim", count, self.embeddings.shape[1])
+            for start in range(0, count, self.TRIM_CHUNK_ROWS):
+                end = min(start + self.TRIM_CHUNK_ROWS, count)
+                trimmed[start:end] = self.embeddings[start:end]
+            trimmed.flush()
+            del trimmed
+            os.replace(f"{self.path}.trim", tmp_path)
+        self.embeddings = None
+        os.replace(tmp_path, self.path)
+
+        ids_path = os.path.join(self.directory, MOVIE_IDS_FILE)
+        _save_array(ids_path, np.asarray(movie_ids, dtype=np.int32))
+        hashes_path = os.path.join(self.directory, MOVIE_HASHES_FILE)
+        _save_array(hashes_path, np.asarray(hashes, dtype=np.uint64))
+        return load_store(self.directory)
+
+
+def load_store(directory: str):
+    """
+    Memory-maps the arrays stored in `directory` (pages are loaded lazily and
+    shared by the OS, so every worker serving the snapshot maps the same
+    physical memory). Returns None when the directory holds no store.
+    """
+    embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+    ids_path = os.path.join(directory, MOVIE_IDS_FILE)
+    if not os.path.exists(embeddings_path) or not os.path.exists(ids_path):
+        return None
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    movie_ids = np.load(ids_path, mmap_mode="r")
+    hashes = None
+    hashes_path = os.path.join(directory, MOVIE_HASHES_FILE)
+    if os.path.exists(hashes_path):
+        hashes = np.load(hashes_path, mmap_mode="r")
+    return EmbeddingStore(embeddings, movie_ids, hashes)
+
+
+def migrate_legacy_cache(directory: str):
+    """
+    Converts an old pickle cache into a store in `directory`.
+    Returns None when there is nothing to convert.
+    """
+    if not os.path.exists(LEGACY_CACHE_PATH):
+        return None
+
+    print("Converting legacy pickle embedding cache...")
+    with open(LEGACY_CACHE_PATH, "rb") as f:
+        cache = pickle.load(f)
+    index_to_id = cache["index_to_id"]
+    movie_ids = [index_to_id[idx] for idx in range(len(index_to_id))]
+    store = save_store(directory, cache["embeddings"], movie_ids)
+    os.remove(LEGACY_CACHE_PATH)
+    return store
@@ -0,0 +1,131 @@
+"""
+Encoder sidecar: one process holds the sentence-transformer model and
+encodes for every API worker over a Unix socket, instead of each uvicorn
+worker loading its own copy of the model and PyTorch.
+
+Run from the backend folder, next to the API:
+    python -m encoder_sidecar &
+    ENCODER_BACKEND=remote uvicorn main:app --workers 4
+
+ENCODER_SIDECAR_BACKEND chooses the model the sidecar runs ("torch" or
+"onnx"). SIGHUP reloads it (e.g. after exporting a new ONNX graph) while
+connections stay open; SIGTERM or SIGINT stop the sidecar and remove the
+socket.
+"""
+
+import os
+import signal
+import socket
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from encoders import (
+    FRAME,
+    ENCODER_SOCKET,
+    load_encoder,
+    pack_vectors,
+    pack_error,
+)
+
+ENCODER_SIDECAR_BACKEND = os.getenv("ENCODER_SIDECAR_BACKEND", "torch")
+
+
+def socket_in_use(path: str) -> bool:
+    """True if a live process is accepting connections on `path`."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class EncoderSidecar:
+    """Serves encode requests on a Unix socket, one model call at a time."""
+
+    def __init__(
+        self, path: str = ENCODER_SOCKET, backend: str = ENCODER_SIDECAR_BACKEND
+    ):
+        self.path = path
+        self.backend = backend
+        self.encoder = load_encoder(backend)
+        # The model already spreads one call over every core
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="encode")
+        self.requests = 0
+        self.connections = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+                    texts = orjson.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break  # Client went away
+
+                # A reload swaps self.encoder between requests, never during one
+                encoder = self.encoder
+                try:
+                    vectors = await loop.run_in_executor(
+                        self.executor, encoder.encode, texts
+                    )
+                    writer.write(pack_vectors(vectors))
+                except Exception as e:
+                    writer.write(pack_error(repr(e)))
+                self.requests += 1
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def reload(self):
+        print(f"Reloading the {self.backend} encoder...")
+        loop = asyncio.get_running_loop()
+        try:
+            self.encoder = await loop.run_in_executor(None, load_encoder, self.backend)
+        except Exception as e:
+            # Keep serving with the model that is already loaded
+            print(f"Encoder reload failed, keeping the current one: {e!r}")
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            if socket_in_use(self.path):
+                raise SystemExit(f"An encoder sidecar is already serving {self.path}")
+            # Left behind by a sidecar that was killed
+            os.unlink(self.path)
+
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        os.chmod(self.path, 0o660)
+
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: asyncio.ensure_future(self.reload())
+        )
+
+        print(f"Encoder sidecar ({self.backend}) listening on {self.path}")
+        try:
+            await stop.wait()
+        finally:
+            # Workers hold their connections open; close them so that
+            # shutdown does not wait on clients
+            server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.executor.shutdown(wait=False)
+        print(f"Encoder sidecar stopped after {self.requests} requests")
+
+
+if __name__ == "__main__":
+    asyncio.run(EncoderSidecar().serve())
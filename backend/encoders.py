@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import socket
+import struct
+import threading
+import numpy as np
+import orjson
+from vector_index import normalize_rows
+
+# Which implementation turns text into vectors: "torch", "onnx" or "remote"
+# (a shared encoder_sidecar.py process, for multi-worker deployments)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_MODEL = os.getenv("ENCODER_MODEL", "all-MiniLM-L6-v2")
+# Output of scripts/export_onnx_encoder.py
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_encoder")
+# "int8" (dynamically quantized) or "fp32" graph inside ONNX_MODEL_DIR
+ONNX_PRECISION = os.getenv("ONNX_PRECISION", "int8")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = let ONNX Runtime decide
+# Unix socket of the encoder sidecar (encoder_sidecar.py), for ENCODER_BACKEND=remote
+ENCODER_SOCKET = os.getenv("ENCODER_SOCKET", "/tmp/movie-encoder.sock")
+# How long a request waits for the sidecar to come (back) up before failing
+ENCODER_SOCKET_TIMEOUT_SECONDS = float(
+    os.getenv("ENCODER_SOCKET_TIMEOUT_SECONDS", "60")
+)
+
+# Sidecar wire format: every message is prefixed with its 4-byte length.
+# Requests are a JSON list of texts; replies a (rows, dim) header and the
+# float32 matrix, or rows = -1 and a UTF-8 error message of `dim` bytes.
+FRAME = struct.Struct(">I")
+VECTORS = struct.Struct(">ii")
+
+
+class SentenceTransformerEncoder:
+    """Full-precision PyTorch encoder, the reference implementation."""
+
+    backend = "torch"
+
+    def __init__(self, model_name: str = ENCODER_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False):
+        """Returns an L2-normalized float32 matrix with one row per text."""
+        embeddings = self.model.encode(
+            list(texts), batch_size=batch_size, show_progress_bar=show_progress_bar
+        )
+        return normalize_rows(embeddings)
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime encoder over an exported transformer graph.
+    Reproduces the sentence-transformers pipeline: mean pooling over the
+    attention mask followed by L2 normalization.
+    """
+
+    backend = "onnx"
+
+    def __init__(
+        self, model_dir: str = ONNX_MODEL_DIR, precision: str = ONNX_PRECISION
+    ):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The onnx encoder backend needs `pip install onnxruntime`"
+            ) from e
+
+        model_path = os.path.join(model_dir, f"model.{precision}.onnx")
+        if not os.path.exists(model_path):
+            raise RuntimeError(
+                f"{model_path} not found, run `python -m scripts.export_onnx_encoder` first"
+            )
+
+        with open(os.path.join(model_dir, "encoder_config.json")) as f:
+            self.max_length = json.load(f)["max_seq_length"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False):
+        """Returns an L2-normalized float32 matrix with one row per text."""
+        texts = list(texts)
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64),
+            }
+            hidden = self.session.run(None, feeds)[0]
+
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            chunks.append(normalize_rows(pooled))
+            if show_progress_bar:
+                print(f"Encoded {min(start + batch_size, len(texts))}/{len(texts)}")
+
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(chunks)
+
+
+def pack_vectors(vectors: np.ndarray) -> bytes:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.size == 0:
+        # sentence-transformers returns a flat empty array for no texts
+        vectors = vectors.reshape(len(vectors), 0)
+    rows, dim = vectors.shape
+    return VECTORS.pack(rows, dim) + vectors.tobytes()
+
+
+def pack_error(message: str) -> bytes:
+    message = message.encode("utf-8")
+    return VECTORS.pack(-1, len(message)) + message
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Encoder sidecar closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+class RemoteEncoder:
+    """
+    Client of the encoder sidecar: texts go over a Unix socket and vectors
+    come back, so API workers never load the model themselves.
+
+    One connection per client, used by one request at a time. Connection
+    errors (the sidecar starting, restarting or reloading) are retried
+    until ENCODER_SOCKET_TIMEOUT_SECONDS; encoding is side-effect free, so
+    a resend is safe.
+    """
+
+    backend = "remote"
+
+    def __init__(
+        self,
+        path: str = ENCODER_SOCKET,
+        timeout: float = ENCODER_SOCKET_TIMEOUT_SECONDS,
+    ):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self._sock
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False):
+        """Returns an L2-normalized float32 matrix with one row per text."""
+        payload = orjson.dumps(list(texts))
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                try:
+                    sock = self._connect()
+                    sock.sendall(FRAME.pack(len(payload)) + payload)
+                    rows, dim = VECTORS.unpack(_recv_exactly(sock, VECTORS.size))
+                    if rows < 0:
+                        error = _recv_exactly(sock, dim).decode("utf-8")
+                        raise RuntimeError(f"Encoder sidecar failed: {error}")
+                    data = _recv_exactly(sock, rows * dim * 4)
+                    return np.frombuffer(data, dtype=np.float32).reshape(rows, dim)
+                except (OSError, ConnectionError) as e:
+                    self.close()
+                    if time.monotonic() >= deadline:
+                        raise RuntimeError(
+                            f"Encoder sidecar unavailable at {self.path}: {e}"
+                        ) from e
+                    time.sleep(0.2)
+
+
+ENCODER_BACKENDS = {
+    SentenceTransformerEncoder.backend: SentenceTransformerEncoder,
+    OnnxEncoder.backend: OnnxEncoder,
+    RemoteEncoder.backend: RemoteEncoder,
+}
+
+
+def load_encoder(backend: str = None):
+    """Instantiates the configured encoder backend."""
+    backend = backend or ENCODER_BACKEND
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend}")
+    encoder = ENCODER_BACKENDS[backend]()
+    print(f"Query encoder: {backend}")
+    return encoder
+
+
+def export_onnx(
+    model_name: str = ENCODER_MODEL, output_dir: str = ONNX_MODEL_DIR, quantize=True
+):
+    """
+    Exports the transformer behind a sentence-transformers model to ONNX and,
+    optionally, writes a dynamically int8-quantized copy next to it.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class _HiddenStates(torch.nn.Module):
+        # Keyword call so the export does not depend on the model's positional signature
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask):
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[
+                0
+            ]
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = _HiddenStates(st_model[0].auto_model).eval()
+    tokenizer = st_model.tokenizer
+
+    fp32_path = os.path.join(output_dir, "model.fp32.onnx")
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}}
+    dynamic_axes["attention_mask"] = dynamic_axes["input_ids"]
+    dynamic_axes["last_hidden_state"] = dynamic_axes["input_ids"]
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "encoder_config.json"), "w") as f:
+        json.dump({"model": model_name, "max_seq_length": st_model.max_seq_length}, f)
+    print(f"Exported {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, "model.int8.onnx")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {int8_path}")
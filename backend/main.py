@@ -1,22 +1,41 @@
 from datetime import datetime, timedelta
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, update, delete, exists, func, literal, true
+from sqlalchemy.dialects.postgresql import array, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import SessionLocal, get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal, get_db, get_async_db, engine, async_engine
 from models import Movie, MovieCategory, Genre, User, Favorite
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 import schemas
 import auth
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import pickle
-import os
-from sentence_transformers import SentenceTransformer
-from sqlalchemy.sql.expression import func
+import metrics
+from metrics import stage
+from encoders import load_encoder
+from embedding_store import migrate_legacy_cache
+from embedding_builder import rebuild_store, RebuildJob
+from search_index import build_search_index, reciprocal_rank_fusion
+from movie_attributes import MovieFilters, build_movie_attributes
+from snapshots import SnapshotManager, SNAPSHOT_POLL_SECONDS
+from user_profiles import (
+    build_user_profile,
+    PROFILE_FAVORITES,
+    USER_PROFILE_CACHE_SIZE,
+    USER_PROFILE_TTL_SECONDS,
+)
+from query_cache import QueryCache, normalize_query
+from query_batcher import QueryBatcher, QueueFullError, BatcherStoppedError
+from response_cache import ResponseCache, json_response, serialize_items
 import secrets
 import random
+import asyncio
 
-app = FastAPI()
+# orjson renders every JSON response (including response_model output),
+# timed as the "serialize" stage
+app = FastAPI(default_response_class=metrics.TimedORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,72 +43,210 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser's network panel show the per-stage timings
+    expose_headers=["Server-Timing"],
 )
+# Request latency, stage timings and the Server-Timing header (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
+# Load a pre-trained semantic model (PyTorch or quantized ONNX, see encoders.py)
+model = load_encoder()
+
+# Versioned embedding matrix + vector index; `snapshots.current` is the live one
+snapshots = SnapshotManager()
+
+# Query text -> (query vector, ranked movie ids, snapshot version); emptied on publish
+query_cache = QueryCache()
+# Pre-serialized home feed carousels, invalidated by the catalog version
+response_cache = ResponseCache()
+# Ranked ids are cached at the largest allowed `limit` so any smaller limit is a slice
+CACHED_RANKING_SIZE = 50
+
+# User id -> UserProfile on the live snapshot; cleared on publish,
+# invalidated per user by toggle_favorite
+user_profiles = QueryCache(USER_PROFILE_CACHE_SIZE, USER_PROFILE_TTL_SECONDS)
 
-# Load a pre-trained semantic model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+metrics.register_cache("query", query_cache)
+metrics.register_cache("response", response_cache)
+metrics.register_cache("user_profile", user_profiles)
+metrics.register_cache("principal", auth.principals)
 
-# Global variables for the recommendation engine
-movie_embeddings = None
-movie_id_to_index = {}
-index_to_movie_id = {}
+# Background /movies/rebuild-embeddings runs and their progress
+rebuild_job = RebuildJob()
 
 # In-memory storage for reset tokens (In production, use Redis or database)
 reset_tokens = {}
 
+# List endpoints select only the columns of a card (schemas.MovieCard)
+MOVIE_CARD_FIELDS = list(schemas.MovieCard.model_fields)
+MOVIE_CARD_COLUMNS = [getattr(Movie, field) for field in MOVIE_CARD_FIELDS]
+
+# Favorites per page of /movies/favorites, newest first
+FAVORITES_PAGE_SIZE = 60
+FAVORITES_MAX_PAGE_SIZE = 200
+
 
 def initialize_recommendation_system(db: Session):
     """
     Initialize system by encoding movie metadata into semantic vectors.
     """
-    global movie_embeddings, movie_id_to_index, index_to_movie_id
-
-    # Load from cache if it exists to save startup time
-    if os.path.exists("movie_embeddings.pkl"):
-        print("Loading cached embeddings...")
-        with open("movie_embeddings.pkl", "rb") as f:
-            cache = pickle.load(f)
-            movie_embeddings = cache["embeddings"]
-            movie_id_to_index = cache["id_to_index"]
-            index_to_movie_id = cache["index_to_id"]
+    # Workers started together wait here while the first one builds, then
+    # map the snapshot it published
+    with snapshots.build_lock():
+        _initialize_recommendation_system(db)
+
+
+def _initialize_recommendation_system(db: Session):
+    # Memory-map the published snapshot if it exists to save startup time
+    snapshot = snapshots.load_current()
+    if snapshot is not None:
+        # Snapshots saved before search and filters existed get them on first load
+        if snapshot.search is None:
+            snapshot.search = build_search_index(db, snapshot.directory)
+        if snapshot.attributes is None:
+            snapshot.attributes = build_movie_attributes(
+                db, snapshot.directory, snapshot.store
+            )
+        publish_snapshot(snapshot)
         print("Embeddings loaded from cache!")
         return
 
-    print("Building semantic movie embeddings (this may take a minute)...")
-    movies = db.query(Movie).all()
-    genres = db.query(Genre).all()
-    genre_map = {g.id: g.name for g in genres}
-
-    movie_texts = []
-    movie_ids = []
-
-    for movie in movies:
-        genre_names = " ".join([genre_map.get(gid, "") for gid in (movie.genres or [])])
-        # We build a natural language description for the AI to "read"
-        text = f"Title: {movie.title}. Genres: {genre_names}. Overview: {movie.overview or ''}"
-        movie_texts.append(text)
-        movie_ids.append(movie.id)
-
-    # Encode all texts into a dense vector matrix (Sample count x 384 dimensions)
-    movie_embeddings = model.encode(movie_texts, show_progress_bar=True)
-
-    movie_id_to_index = {movie_id: idx for idx, movie_id in enumerate(movie_ids)}
-    index_to_movie_id = {idx: movie_id for idx, movie_id in enumerate(movie_ids)}
-
-    with open("movie_embeddings.pkl", "wb") as f:
-        pickle.dump(
-            {
-                "embeddings": movie_embeddings,
-                "id_to_index": movie_id_to_index,
-                "index_to_id": index_to_movie_id,
-            },
-            f,
-        )
-    print(f"Embeddings built for {len(movies)} movies!")
+    version, directory = snapshots.new_directory()
+    try:
+        store = migrate_legacy_cache(directory)
+        if store is None:
+            print("Building semantic movie embeddings (this may take a minute)...")
+            store = rebuild_store(db, model, directory)
+        if store is None:
+            # Served without a snapshot until movies are ingested and rebuilt
+            print("No movies to embed yet")
+            snapshots.discard(directory)
+            return
+        build_search_index(db, directory)
+        build_movie_attributes(db, directory, store)
+        snapshot = snapshots.build(version, directory, store)
+    except Exception:
+        snapshots.discard(directory)
+        raise
+    publish_snapshot(snapshot)
+    print(f"Embeddings built for {len(store)} movies!")
+
+
+def publish_snapshot(snapshot):
+    """Swaps in a new live snapshot and drops rankings computed on older ones."""
+    snapshots.publish(snapshot)
+    query_cache.clear()
+    user_profiles.clear()
+
+
+def refresh_snapshot() -> bool:
+    """Follows a snapshot another worker published; True if it changed."""
+    if snapshots.refresh() is None:
+        return False
+    query_cache.clear()
+    user_profiles.clear()
+    return True
+
+
+async def watch_snapshots():
+    """Keeps this worker on the snapshot other workers rebuild or roll back to."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        try:
+            await run_in_threadpool(refresh_snapshot)
+        except Exception as e:
+            print(f"Snapshot refresh failed: {e!r}")
+
+
+def run_embedding_rebuild(job: RebuildJob, full: bool):
+    """
+    Background body of /movies/rebuild-embeddings. The new snapshot is built
+    in its own directory while requests keep reading the live one.
+    """
+    # One rebuild at a time across workers, starting from the latest snapshot
+    with snapshots.build_lock():
+        refresh_snapshot()
+        _run_embedding_rebuild(job, full)
 
 
-@app.on_event("startup")
-async def startup_event():
+def _run_embedding_rebuild(job: RebuildJob, full: bool):
+    live = snapshots.current
+    version, directory = snapshots.new_directory()
+    db = SessionLocal()
+    try:
+        # Only new or changed movies are encoded; the rest reuse their vectors
+        previous = live.store if live else None
+        store = rebuild_store(db, model, directory, previous, progress=job, full=full)
+        if store is None:
+            raise RuntimeError("No movies to embed")
+        # Search index and filter columns come from the same catalog, into
+        # the same snapshot
+        job.update(stage="search index")
+        build_search_index(db, directory)
+        build_movie_attributes(db, directory, store)
+
+        # Vector index and neighbour table are refreshed with every rebuild
+        job.update(stage="indexing")
+        snapshot = snapshots.build(version, directory, store)
+    except Exception:
+        # The live snapshot stays; the half-written one is not kept
+        snapshots.discard(directory)
+        raise
+    finally:
+        db.close()
+
+    publish_snapshot(snapshot)
+    job.update(version=version)
+    print(f"Embeddings rebuilt for {len(store)} movies!")
+
+
+async def current_snapshot(response: Response):
+    """
+    The live snapshot for this request (loading one on first use), also
+    reported in the X-Index-Version header. 503 while no movies are embedded.
+    """
+    if snapshots.current is None:
+        await run_in_threadpool(ensure_recommendation_system)
+    snapshot = snapshots.current
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="No movies have been embedded yet")
+    response.headers["X-Index-Version"] = snapshot.version
+    return snapshot
+
+
+def rank_query_batch(queries: list) -> list:
+    """
+    Encodes a batch of normalized queries in one forward pass and ranks them
+    together. Returns, per query, the cache entry (query vector, ranked movie
+    ids, version) and the batch's stage timings for the Server-Timing header,
+    since the batcher worker runs outside of any request.
+    """
+    snapshot = snapshots.current
+
+    with metrics.capture_stages() as timings:
+        # Encode user queries into the same semantic space
+        with stage("encode"):
+            query_embeddings = model.encode(queries)
+
+        # Nearest movies by cosine similarity, best first
+        with stage("vector_search"):
+            top_indices, _ = snapshot.index.search_batch(
+                query_embeddings, CACHED_RANKING_SIZE
+            )
+    return [
+        ((embedding, snapshot.store.ids_at(rows), snapshot.version), timings.stages)
+        for embedding, rows in zip(query_embeddings, top_indices)
+    ]
+
+
+# Concurrent ai-recommend queries share one encode call instead of batch size 1
+query_batcher = QueryBatcher(rank_query_batch)
+
+
+def ensure_recommendation_system():
+    """Loads or builds the live snapshot with a short-lived sync session."""
     db = SessionLocal()
     try:
         initialize_recommendation_system(db)
@@ -97,218 +254,473 @@ async def startup_event():
         db.close()
 
 
-@app.get("/movies/ai-recommend")
-def ai_recommend_movies(
+# Polls for snapshots published by other uvicorn workers
+snapshot_watcher = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    global snapshot_watcher
+    ensure_recommendation_system()
+    await query_batcher.start()
+    if SNAPSHOT_POLL_SECONDS > 0:
+        snapshot_watcher = asyncio.create_task(watch_snapshots())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if snapshot_watcher is not None:
+        snapshot_watcher.cancel()
+    await query_batcher.stop()
+    # The remote encoder holds a connection to the sidecar
+    if hasattr(model, "close"):
+        model.close()
+
+
+def movie_filters(
+    genres: list[int] = Query(None, description="Genre ids the movie must all have"),
+    year_from: int | None = Query(None, ge=1870, le=2100),
+    year_to: int | None = Query(None, ge=1870, le=2100),
+    max_runtime: int | None = Query(None, ge=1, description="Minutes"),
+    min_rating: float | None = Query(None, ge=0, le=10),
+    popularity_weight: float = Query(
+        0.0, ge=0, le=1, description="Blend popularity into the score"
+    ),
+    rating_weight: float = Query(
+        0.0, ge=0, le=1, description="Blend the rating into the score"
+    ),
+):
+    """Metadata filters of the semantic endpoints; None when none is set."""
+    filters = MovieFilters(
+        genres,
+        year_from,
+        year_to,
+        max_runtime,
+        min_rating,
+        popularity_weight,
+        rating_weight,
+    )
+    return filters or None
+
+
+def search_filtered(snapshot, vector, k: int, filters: MovieFilters, skip=None):
+    """
+    Rows nearest to `vector` among those passing `filters`, with their
+    popularity/rating blend. The mask is applied before top-k selection, so
+    the result is exact and complete with no extra queries.
+    """
+    if snapshot.attributes is None:
+        raise HTTPException(
+            status_code=503, detail="Filters are unavailable until the next rebuild"
+        )
+    exclude = snapshot.attributes.exclude_mask(filters)
+    if skip is not None:
+        exclude[skip] = True
+    boost = snapshot.attributes.boost(filters)
+    rows, _ = snapshot.index.search(vector, k, exclude=exclude, boost=boost)
+    return rows
+
+
+async def rank_movies_for_query(query: str, limit: int, filters=None):
+    """
+    Movie ids closest to a free-text query, best first, and the version of
+    the snapshot they were ranked on.
+    Repeated queries are served from the cache without running the encoder;
+    with `filters`, the cached query vector is searched again under them.
+    """
+    key = normalize_query(query)
+    cached = query_cache.get(key)
+    if cached is None:
+        generation = query_cache.generation
+        try:
+            # Queueing, encoding and searching, shared with the rest of the batch
+            with stage("rank"):
+                cached, batch_stages = await query_batcher.submit(key)
+            metrics.add_request_stages(batch_stages)
+        except QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Recommendation engine is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        except BatcherStoppedError:
+            raise HTTPException(status_code=503, detail="Server is shutting down")
+        query_cache.put(key, cached, generation)
+
+    embedding, ranked_movie_ids, version = cached
+    if not filters:
+        return ranked_movie_ids[:limit], version
+
+    snapshot = snapshots.current
+    with stage("filtered_search"):
+        rows = await run_in_threadpool(
+            search_filtered, snapshot, embedding, limit, filters
+        )
+    return snapshot.store.ids_at(rows), snapshot.version
+
+
+def movie_cards(rows) -> list:
+    """Rows of a MOVIE_CARD_COLUMNS select as plain dicts, cheap to serialize."""
+    return [dict(zip(MOVIE_CARD_FIELDS, row)) for row in rows]
+
+
+async def fetch_movie_cards(db: AsyncSession, movie_ids) -> dict:
+    """Movie id -> card for the given ids, with one IN query."""
+    rows = await db.execute(select(*MOVIE_CARD_COLUMNS).where(Movie.id.in_(movie_ids)))
+    return {card["id"]: card for card in movie_cards(rows)}
+
+
+async def fetch_movies_in_order(db: AsyncSession, movie_ids: list) -> list:
+    """Loads movie cards with one IN query and returns them in the given order."""
+    movie_dict = await fetch_movie_cards(db, movie_ids)
+    return [movie_dict[mid] for mid in movie_ids if mid in movie_dict]
+
+
+@app.get("/movies/ai-recommend", response_model=schemas.RankedMovies)
+async def ai_recommend_movies(
+    response: Response,
     query: str = Query(..., description="User's mood or preference description"),
     limit: int = Query(20, ge=1, le=50),
-    db: Session = Depends(get_db),
+    filters: MovieFilters | None = Depends(movie_filters),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    global movie_embeddings, movie_id_to_index, index_to_movie_id
+    await current_snapshot(response)
 
-    if movie_embeddings is None:
-        initialize_recommendation_system(db)
+    recommended_movie_ids, version = await rank_movies_for_query(query, limit, filters)
+    response.headers["X-Index-Version"] = version
 
-    # Encode user query into the same semantic space
-    query_embedding = model.encode([query])
-    similarities = cosine_similarity(query_embedding, movie_embeddings)[0]
+    # Fetch movie data and maintain similarity order
+    results = await fetch_movies_in_order(db, recommended_movie_ids)
+    return {"results": results, "index_version": version}
 
-    # Sort indices by highest similarity
-    top_indices = np.argsort(similarities)[::-1][:limit]
-    recommended_movie_ids = [index_to_movie_id[idx] for idx in top_indices]
 
-    # Fetch movie data and maintain similarity order
-    movies = db.query(Movie).filter(Movie.id.in_(recommended_movie_ids)).all()
-    movie_dict = {movie.id: movie for movie in movies}
+@app.get("/movies/search", response_model=schemas.RankedMovies)
+async def search_movies(
+    response: Response,
+    query: str = Query(..., min_length=1, description="Title or description"),
+    limit: int = Query(20, ge=1, le=50),
+    semantic: bool = Query(True, description="Blend in embedding matches"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Hybrid search: BM25 over titles, genres and overviews (with prefix and
+    typo-tolerant title matching) fused with the embedding ranking by
+    reciprocal rank fusion. Title lookups, where the best lexical hit has
+    every query word in its title, are answered without the encoder.
+    """
+    snapshot = await current_snapshot(response)
+
+    movie_ids, title_match = [], False
+    if snapshot.search is not None:
+        with stage("lexical_search"):
+            hits = await run_in_threadpool(
+                snapshot.search.search, query, CACHED_RANKING_SIZE
+            )
+        movie_ids, title_match = hits.movie_ids, hits.title_match
+    if semantic and not title_match:
+        semantic_ids, _ = await rank_movies_for_query(query, CACHED_RANKING_SIZE)
+        with stage("fusion"):
+            movie_ids = reciprocal_rank_fusion([movie_ids, semantic_ids])
+
+    results = await fetch_movies_in_order(db, movie_ids[:limit])
+    return {"results": results, "index_version": snapshot.version}
+
+
+@app.get("/movies/recommend", response_model=schemas.MoodMovies)
+async def recommend_by_mood(
+    response: Response,
+    mood: str = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Legacy endpoint wrapper for the AI engine."""
+    res = await ai_recommend_movies(response, query=mood, limit=20, filters=None, db=db)
+    return {"movies": res["results"], "index_version": res["index_version"]}
 
-    results = [movie_dict[mid] for mid in recommended_movie_ids if mid in movie_dict]
-    return {"results": results}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint: latencies, stage timings, query counts, caches."""
+    return Response(metrics.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
 
-@app.get("/movies/recommend")
-def recommend_by_mood(mood: str = Query(...), db: Session = Depends(get_db)):
-    """Legacy endpoint wrapper for the AI engine."""
-    res = ai_recommend_movies(query=mood, limit=20, db=db)
-    return {"movies": res["results"]}
 
+@app.get("/movies/ai-recommend/cache-stats")
+def get_query_cache_stats():
+    """Hit/miss and eviction counters of the query cache."""
+    return query_cache.stats()
 
-@app.get("/movies/trending")
-def get_trending(db: Session = Depends(get_db)):
-    return db.query(Movie).order_by(Movie.popularity.desc()).limit(20).all()
 
+@app.get("/movies/response-cache-stats")
+def get_response_cache_stats():
+    """Hit/miss counters and catalog version of the home feed response cache."""
+    return response_cache.stats()
 
-@app.get("/movies/top-rated")
-def get_top_rated(db: Session = Depends(get_db)):
-    return (
-        db.query(Movie)
-        .join(MovieCategory)
-        .filter(MovieCategory.category_name == "top_rated")
-        .order_by(Movie.vote_average.desc())
-        .limit(20)
-        .all()
-    )
 
+@app.get("/movies/trending", response_model=list[schemas.MovieCard])
+async def get_trending(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        rows = await db.execute(
+            select(*MOVIE_CARD_COLUMNS).order_by(Movie.popularity.desc()).limit(20)
+        )
+        return movie_cards(rows)
 
-# Endpoint for New Releases (Sorted by date)
-@app.get("/movies/new-releases")
-def get_new_releases(db: Session = Depends(get_db)):
-    three_months_ago = datetime.now() - timedelta(days=90)
-
-    return (
-        db.query(Movie)
-        .filter(Movie.release_date >= three_months_ago)  # Only recent
-        .order_by(Movie.popularity.desc())  # But most popular first
-        .limit(20)
-        .all()
-    )
+    cached = await response_cache.get_or_load(db, "trending", load)
+    return json_response(request, cached.body, cached.etag)
 
 
-# Endpoint to discover 3 random genres and their top movies
-@app.get("/movies/genre-discovery")
-def get_genre_discovery(db: Session = Depends(get_db)):
-    random_genres = db.query(Genre).order_by(func.random()).limit(3).all()
-
-    discovery_results = []
-    for genre in random_genres:
-        movies = (
-            db.query(Movie)
-            .filter(Movie.genres.contains([genre.id]))
-            .order_by(Movie.popularity.desc())
-            .limit(15)
-            .all()
+@app.get("/movies/top-rated", response_model=list[schemas.MovieCard])
+async def get_top_rated(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        rows = await db.execute(
+            select(*MOVIE_CARD_COLUMNS)
+            .join(MovieCategory)
+            .where(MovieCategory.category_name == "top_rated")
+            .order_by(Movie.vote_average.desc())
+            .limit(20)
         )
+        return movie_cards(rows)
 
-        if movies:
-            discovery_results.append({"genre_name": genre.name, "movies": movies})
+    cached = await response_cache.get_or_load(db, "top-rated", load)
+    return json_response(request, cached.body, cached.etag)
 
-    return discovery_results
 
+# Endpoint for New Releases (Sorted by date)
+@app.get("/movies/new-releases", response_model=list[schemas.MovieCard])
+async def get_new_releases(request: Request, db: AsyncSession = Depends(get_async_db)):
+    today = datetime.now().date()
+    three_months_ago = today - timedelta(days=90)
+
+    async def load():
+        rows = await db.execute(
+            select(*MOVIE_CARD_COLUMNS)
+            .where(Movie.release_date >= three_months_ago)  # Only recent
+            .order_by(Movie.popularity.desc())  # But most popular first
+            .limit(20)
+        )
+        return movie_cards(rows)
 
-@app.post("/movies/rebuild-embeddings")
-def rebuild_embeddings(db: Session = Depends(get_db)):
-    if os.path.exists("movie_embeddings.pkl"):
-        os.remove("movie_embeddings.pkl")
-    initialize_recommendation_system(db)
-    return {"status": "success"}
+    # The window moves daily, so the day is part of the key
+    cached = await response_cache.get_or_load(db, f"new-releases:{today}", load)
+    return json_response(request, cached.body, cached.etag)
 
 
-@app.get("/movies/favorites")
-def get_user_favorites(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth.get_current_user),
+# Endpoint to discover 3 random genres and their top movies
+@app.get("/movies/genre-discovery", response_model=list[schemas.GenreRow])
+async def get_genre_discovery(
+    request: Request, db: AsyncSession = Depends(get_async_db)
 ):
-    # Get all favorite records for this user
-    favorite_records = (
-        db.query(Favorite).filter(Favorite.user_id == current_user.id).all()
+    async def load():
+        # Top 15 of every genre in one query: a LATERAL subquery per genre row,
+        # answered from the GIN index on movies.genres
+        top_movies = (
+            select(*MOVIE_CARD_COLUMNS, Movie.popularity)
+            .where(Movie.genres.contains(array([Genre.id])))
+            .order_by(Movie.popularity.desc())
+            .limit(15)
+            .lateral("top_movies")
+        )
+        rows = await db.execute(
+            select(
+                Genre.id.label("genre_id"),
+                Genre.name.label("genre_name"),
+                *[top_movies.c[field] for field in MOVIE_CARD_FIELDS],
+            )
+            .join(top_movies, true())
+            .order_by(Genre.id, top_movies.c.popularity.desc())
+        )
+
+        # Genres without movies produce no rows and are skipped
+        discovery_results = {}
+        for genre_id, genre_name, *card in rows:
+            if genre_id not in discovery_results:
+                discovery_results[genre_id] = {"genre_name": genre_name, "movies": []}
+            card = dict(zip(MOVIE_CARD_FIELDS, card))
+            discovery_results[genre_id]["movies"].append(card)
+
+        return list(discovery_results.values())
+
+    # Every genre's row is cached; the random pick happens per request
+    cached = await response_cache.get_or_load(
+        db, "genre-discovery", load, serializer=serialize_items
     )
+    genres = cached.items()
+    picked = random.sample(genres, min(3, len(genres)))
+    return json_response(request, b"[" + b",".join(picked) + b"]")
 
-    if not favorite_records:
-        return {"favorites": []}
 
-    # Extract movie IDs
-    movie_ids = [fav.movie_id for fav in favorite_records]
+@app.post("/movies/rebuild-embeddings", status_code=status.HTTP_202_ACCEPTED)
+def rebuild_embeddings(
+    full: bool = Query(False, description="Re-encode every movie, ignoring hashes"),
+):
+    """Starts a background rebuild; poll GET /movies/rebuild-embeddings for progress."""
+    if not rebuild_job.start(lambda job: run_embedding_rebuild(job, full)):
+        raise HTTPException(status_code=409, detail="A rebuild is already running")
+    return rebuild_job.status()
 
-    # Fetch complete movie details
-    movies = db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
 
-    # Create a dictionary for quick lookup
-    movie_dict = {movie.id: movie for movie in movies}
+@app.get("/movies/rebuild-embeddings")
+def get_rebuild_status():
+    return {**rebuild_job.status(), "snapshots": snapshots.info()}
 
-    # Return movies in the order they were favorited (most recent first)
-    ordered_movies = []
-    for fav in reversed(favorite_records):
-        if fav.movie_id in movie_dict:
-            ordered_movies.append(movie_dict[fav.movie_id])
 
-    return {"favorites": ordered_movies}
+@app.post("/movies/rebuild-embeddings/rollback")
+def rollback_embeddings():
+    """Re-publishes the previous embedding snapshot kept on disk."""
+    snapshot = snapshots.rollback()
+    if snapshot is None:
+        raise HTTPException(
+            status_code=404, detail="No previous snapshot to roll back to"
+        )
+    query_cache.clear()
+    user_profiles.clear()
+    return snapshots.info()
 
 
-@app.get("/movies/personalized-recommendations")
-def get_personalized_recommendations(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth.get_current_user),
+@app.get("/movies/favorites", response_model=schemas.FavoriteMovies)
+async def get_user_favorites(
+    limit: int = Query(FAVORITES_PAGE_SIZE, ge=1, le=FAVORITES_MAX_PAGE_SIZE),
+    cursor: int | None = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     """
-    Get personalized movie recommendations based on user's favorites.
-    Returns recommendations for 2 randomly selected favorited movies.
+    The user's favorite movies, most recently favorited first, one page at a
+    time. Pages are cut by favorite id (keyset pagination) along the
+    (user_id, id) index, so deep pages cost the same as the first one.
     """
-    global movie_embeddings, movie_id_to_index, index_to_movie_id
-
-    if movie_embeddings is None:
-        initialize_recommendation_system(db)
-
-    # Get user's favorite movies
-    favorite_records = (
-        db.query(Favorite)
-        .filter(Favorite.user_id == current_user.id)
+    stmt = (
+        select(Favorite.id, *MOVIE_CARD_COLUMNS)
+        .join(Movie, Movie.id == Favorite.movie_id)
+        .where(Favorite.user_id == current_user.id)
         .order_by(Favorite.id.desc())
-        .limit(5)  # Get up to 5 most recent favorites
-        .all()
+        # One extra row tells whether there is a next page
+        .limit(limit + 1)
     )
+    if cursor is not None:
+        stmt = stmt.where(Favorite.id < cursor)
+    rows = (await db.execute(stmt)).all()
 
-    if not favorite_records:
-        return {"recommendations": []}
-
-    # Randomly select up to 2 favorites
+    page = rows[:limit]
+    next_cursor = page[-1][0] if len(rows) > limit else None
+    return {
+        "favorites": movie_cards(row[1:] for row in page),
+        "next_cursor": next_cursor,
+    }
 
-    selected_favorites = random.sample(favorite_records, min(2, len(favorite_records)))
 
-    recommendations = []
+@app.get("/movies/favorites/count", response_model=schemas.FavoriteCount)
+async def count_user_favorites(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    count = await db.scalar(
+        select(func.count()).where(Favorite.user_id == current_user.id)
+    )
+    return {"count": count}
 
-    for fav in selected_favorites:
-        movie_id = fav.movie_id
 
-        # Get the base movie
-        base_movie = db.query(Movie).filter(Movie.id == movie_id).first()
-        if not base_movie or movie_id not in movie_id_to_index:
-            continue
+@app.get(
+    "/movies/personalized-recommendations",
+    response_model=schemas.PersonalizedRecommendations,
+)
+async def get_personalized_recommendations(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Get personalized movie recommendations based on user's favorites.
+    Returns recommendations for 2 randomly selected favorited movies, plus a
+    "for you" list ranked against the blend of all recent favorites.
+    """
+    snapshot = await current_snapshot(response)
+
+    profile = user_profiles.get(current_user.id)
+    if profile is None:
+        generation = user_profiles.generation
+        # Get user's favorite movies (up to 5 most recent)
+        favorite_ids = (
+            await db.scalars(
+                select(Favorite.movie_id)
+                .where(Favorite.user_id == current_user.id)
+                .order_by(Favorite.id.desc())
+                .limit(PROFILE_FAVORITES)
+            )
+        ).all()
+        with stage("profile"):
+            profile = await run_in_threadpool(
+                build_user_profile, snapshot, favorite_ids
+            )
+        user_profiles.put(current_user.id, profile, generation)
+
+    if not profile.similar:
+        return {"recommendations": [], "for_you": [], "index_version": snapshot.version}
 
-        # Get similar movies
-        movie_idx = movie_id_to_index[movie_id]
-        movie_emb = movie_embeddings[movie_idx].reshape(1, -1)
-        similarities = cosine_similarity(movie_emb, movie_embeddings)[0]
+    # Randomly select up to 2 favorites
+    selected = random.sample(list(profile.similar), min(2, len(profile.similar)))
 
-        # Get top 20 similar movies (excluding the movie itself)
-        top_indices = np.argsort(similarities)[::-1][1:21]
-        similar_movie_ids = [index_to_movie_id[idx] for idx in top_indices]
+    # One query for the base movies and every recommended movie
+    needed_ids = set(selected).union(profile.for_you)
+    for movie_id in selected:
+        needed_ids.update(profile.similar[movie_id])
+    movie_dict = await fetch_movie_cards(db, needed_ids)
 
-        # Fetch movie details
-        similar_movies = db.query(Movie).filter(Movie.id.in_(similar_movie_ids)).all()
-        movie_dict = {m.id: m for m in similar_movies}
+    recommendations = []
+    for movie_id in selected:
+        base_movie = movie_dict.get(movie_id)
+        if not base_movie:
+            continue
         sorted_movies = [
-            movie_dict[mid] for mid in similar_movie_ids if mid in movie_dict
+            movie_dict[mid] for mid in profile.similar[movie_id] if mid in movie_dict
         ]
-
         recommendations.append(
             {"base_movie": base_movie, "similar_movies": sorted_movies}
         )
 
-    return {"recommendations": recommendations}
+    for_you = [movie_dict[mid] for mid in profile.for_you if mid in movie_dict]
+    return {
+        "recommendations": recommendations,
+        "for_you": for_you,
+        "index_version": snapshot.version,
+    }
 
 
 @app.post("/auth/register", response_model=schemas.Token)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User.id).where(User.email == user.email))
+    # Hand the connection back to the pool before the slow bcrypt hash
+    await db.close()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = User(email=user.email, hashed_password=auth.hash_password(user.password))
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # bcrypt runs on its own threads (see auth.PasswordHasher)
+    hashed_password = await auth.password_hasher.hash(user.password)
+    db.add(User(email=user.email, hashed_password=hashed_password))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Registered by a concurrent request while this one was hashing
+        raise HTTPException(status_code=400, detail="Email already registered")
     return {
-        "access_token": auth.create_access_token(data={"sub": new_user.email}),
+        "access_token": auth.create_access_token(data={"sub": user.email}),
         "token_type": "bearer",
     }
 
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    hashed_password = await db.scalar(
+        select(User.hashed_password).where(User.email == form_data.username)
+    )
+    # Hand the connection back to the pool before the slow bcrypt check
+    await db.close()
+    if not hashed_password or not await auth.password_hasher.verify(
+        form_data.password, hashed_password
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     return {
-        "access_token": auth.create_access_token(data={"sub": user.email}),
+        "access_token": auth.create_access_token(data={"sub": form_data.username}),
         "token_type": "bearer",
     }
 
@@ -345,7 +757,9 @@ def forgot_password(email: str, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/reset-password")
-def reset_password(token: str, new_password: str, db: Session = Depends(get_db)):
+async def reset_password(
+    token: str, new_password: str, db: AsyncSession = Depends(get_async_db)
+):
     """
     Reset password using the provided token.
     """
@@ -361,13 +775,23 @@ def reset_password(token: str, new_password: str, db: Session = Depends(get_db))
         raise HTTPException(status_code=400, detail="Reset token has expired")
 
     # Find user
-    user = db.query(User).filter(User.email == token_data["email"]).first()
+    user = (
+        await db.execute(
+            select(User.id, User.email).where(User.email == token_data["email"])
+        )
+    ).first()
+    # Hand the connection back to the pool before the slow bcrypt hash
+    await db.close()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Update password
-    user.hashed_password = auth.hash_password(new_password)
-    db.commit()
+    hashed_password = await auth.password_hasher.hash(new_password)
+    await db.execute(
+        update(User).where(User.id == user.id).values(hashed_password=hashed_password)
+    )
+    await db.commit()
+    auth.invalidate_principal(user.email)
 
     # Delete used token
     del reset_tokens[token]
@@ -375,68 +799,115 @@ def reset_password(token: str, new_password: str, db: Session = Depends(get_db))
     return {"message": "Password has been reset successfully"}
 
 
-@app.post("/movies/favorite/{movie_id}")
-def toggle_favorite(
+@app.get("/movies/favorite/{movie_id}", response_model=schemas.FavoriteStatus)
+async def get_favorite_status(
     movie_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    # 1. Check if movie exists
-    movie = db.query(Movie).filter(Movie.id == movie_id).first()
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
+    favorited = await db.scalar(
+        select(
+            exists().where(
+                Favorite.user_id == current_user.id, Favorite.movie_id == movie_id
+            )
+        )
+    )
+    return {"favorited": favorited}
 
-    # 2. Check if already favorited
-    existing_fav = (
-        db.query(Favorite)
-        .filter(Favorite.user_id == current_user.id, Favorite.movie_id == movie_id)
-        .first()
+
+@app.post("/movies/favorite/{movie_id}")
+async def toggle_favorite(
+    movie_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    """
+    Adds or removes a favorite in one atomic statement: the DELETE ...
+    RETURNING removes an existing favorite, and only when it removed nothing
+    does the INSERT run, guarded by _user_movie_uc against concurrent toggles.
+    """
+    removed = (
+        delete(Favorite)
+        .where(Favorite.user_id == current_user.id, Favorite.movie_id == movie_id)
+        .returning(Favorite.id)
+        .cte("removed")
+    )
+    movie_exists = exists().where(Movie.id == movie_id)
+    added = (
+        insert(Favorite)
+        .from_select(
+            ["user_id", "movie_id"],
+            select(literal(current_user.id), literal(movie_id)).where(
+                ~exists(select(removed.c.id)), movie_exists
+            ),
+        )
+        .on_conflict_do_nothing(constraint="_user_movie_uc")
+        .returning(Favorite.id)
+        .cte("added")
     )
+    result = (
+        await db.execute(
+            select(
+                exists(select(removed.c.id)).label("removed"),
+                exists(select(added.c.id)).label("added"),
+                movie_exists.label("movie_exists"),
+            )
+        )
+    ).one()
+    await db.commit()
 
-    if existing_fav:
-        db.delete(existing_fav)
-        db.commit()
+    if result.removed:
+        user_profiles.invalidate(current_user.id)
         return {"status": "removed", "message": "Removed from favorites"}
+    if not result.movie_exists:
+        raise HTTPException(status_code=404, detail="Movie not found")
 
-    # 3. Add to favorites
-    new_fav = Favorite(user_id=current_user.id, movie_id=movie_id)
-    db.add(new_fav)
-    db.commit()
+    # Added now, or by a concurrent toggle that won the race
+    user_profiles.invalidate(current_user.id)
     return {"status": "added", "message": "Added to favorites"}
 
 
-@app.get("/movies/{movie_id}")
-def get_movie_by_id(movie_id: int, db: Session = Depends(get_db)):
-    movie = db.query(Movie).filter(Movie.id == movie_id).first()
+@app.get("/movies/{movie_id}", response_model=schemas.MovieDetail)
+async def get_movie_by_id(movie_id: int, db: AsyncSession = Depends(get_async_db)):
+    movie = await db.get(Movie, movie_id)
     if not movie:
         raise HTTPException(status_code=404, detail="Movie not found")
     return movie
 
 
-@app.get("/movies/similar/{movie_id}")
-def get_similar_movies(
-    movie_id: int, limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db)
+@app.get("/movies/similar/{movie_id}", response_model=schemas.SimilarMovies)
+async def get_similar_movies(
+    movie_id: int,
+    response: Response,
+    limit: int = Query(10, ge=1, le=50),
+    filters: MovieFilters | None = Depends(movie_filters),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    global movie_embeddings, movie_id_to_index, index_to_movie_id
-
-    if movie_embeddings is None:
-        initialize_recommendation_system(db)
+    snapshot = await current_snapshot(response)
+    store = snapshot.store
 
-    if movie_id not in movie_id_to_index:
+    movie_idx = store.index_of(movie_id)
+    if movie_idx is None:
         raise HTTPException(status_code=404, detail="Movie not found in index")
 
-    movie_idx = movie_id_to_index[movie_id]
-
-    # Reshape 1D vector to 2D (1, 384) for Scikit-Learn compatibility
-    movie_emb = movie_embeddings[movie_idx].reshape(1, -1)
-    similarities = cosine_similarity(movie_emb, movie_embeddings)[0]
-
-    # Get top N similar (skip index 0 as it is the movie itself)
-    top_indices = np.argsort(similarities)[::-1][1 : limit + 1]
-    similar_movie_ids = [index_to_movie_id[idx] for idx in top_indices]
-
-    movies_list = db.query(Movie).filter(Movie.id.in_(similar_movie_ids)).all()
-    movie_dict = {m.id: m for m in movies_list}
-    sorted_movies = [movie_dict[mid] for mid in similar_movie_ids if mid in movie_dict]
-
-    return {"similar_movies": sorted_movies}
+    if filters:
+        with stage("filtered_search"):
+            top_indices = await run_in_threadpool(
+                search_filtered,
+                snapshot,
+                store.embeddings[movie_idx],
+                limit,
+                filters,
+                skip=movie_idx,
+            )
+    else:
+        # Get top N similar, never the movie itself (precomputed when available)
+        with stage("neighbors"):
+            top_indices = await run_in_threadpool(
+                snapshot.similar_rows, movie_idx, limit
+            )
+    similar_movie_ids = store.ids_at(top_indices)
+
+    sorted_movies = await fetch_movies_in_order(db, similar_movie_ids)
+
+    return {"similar_movies": sorted_movies, "index_version": snapshot.version}
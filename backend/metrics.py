@@ -0,0 +1,368 @@
+"""
+Request instrumentation: stage timers, database query timings and cache
+hit ratios, exposed in Prometheus text format (GET /metrics) and per
+request in a Server-Timing header.
+
+    with stage("encode"):
+        vectors = model.encode(texts)
+
+records into the movie_api_stage_seconds histogram and, inside a request,
+into that request's Server-Timing header. Recording is a couple of clock
+reads and a locked counter increment, cheap enough to leave on.
+
+Every process keeps its own numbers: with several uvicorn workers, each
+scrape reads the worker that answers it.
+"""
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from fastapi.responses import ORJSONResponse
+
+# Set to "false" to keep stage timings out of responses (they stay in /metrics)
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"
+
+# Upper bounds in seconds, from a sub-millisecond cache hit to a cold encode
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = [
+                (labelvalues, list(counts), total)
+                for labelvalues, (counts, total) in self._series.items()
+            ]
+        for labelvalues, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "movie_api_request_seconds",
+    "Time from request to the end of the response.",
+    ("method", "route"),
+)
+REQUESTS = Counter(
+    "movie_api_requests_total", "Requests answered.", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "movie_api_stage_seconds", "Time spent in one stage of a request.", ("stage",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "movie_api_db_query_seconds", "Time of one database round trip."
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "movie_api_db_queries_per_request",
+    "Database round trips made by one request.",
+    buckets=QUERY_COUNT_BUCKETS,
+)
+METRICS = [
+    REQUEST_SECONDS,
+    REQUESTS,
+    STAGE_SECONDS,
+    DB_QUERY_SECONDS,
+    DB_QUERIES_PER_REQUEST,
+]
+
+# Cache name -> QueryCache-like object (stats() with hits, misses, hit_ratio, size)
+CACHES = {}
+
+
+class RequestTimings:
+    """Stage durations of one request, for its Server-Timing header."""
+
+    __slots__ = ("stages", "db_queries", "db_seconds")
+
+    def __init__(self):
+        # Stage name -> seconds, in first-seen order
+        self.stages = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        entries = [
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()
+        ]
+        if self.db_queries:
+            queries = "query" if self.db_queries == 1 else "queries"
+            entries.append(
+                f'db;dur={self.db_seconds * 1000:.2f};desc="{self.db_queries} {queries}"'
+            )
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Timings of the request being handled; copied into threadpool calls, so
+# sync endpoints and run_in_threadpool work record into the same object
+_current_request = ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _current_request.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def capture_stages():
+    """
+    Times the stages inside it into a fresh RequestTimings instead of the
+    current request's, for work done on behalf of several requests (a query
+    batch). Each of those requests then passes the stages to
+    add_request_stages.
+    """
+    timings = RequestTimings()
+    token = _current_request.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_request.reset(token)
+
+
+def add_request_stages(stages: dict):
+    """Adds stages timed elsewhere (already in the histogram) to Server-Timing."""
+    timings = _current_request.get()
+    if timings is not None:
+        for name, seconds in stages.items():
+            timings.add(name, seconds)
+
+
+class stage:
+    """Context manager timing one named stage (see the module docstring)."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.started)
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that records its rendering as the "serialize" stage."""
+
+    def render(self, content) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+
+def register_cache(name: str, cache):
+    """Exports the hit/miss counters of a QueryCache-like object."""
+    CACHES[name] = cache
+
+
+# Exported per registered cache: (name, type, help, value from stats())
+CACHE_METRICS = (
+    (
+        "movie_api_cache_hits_total",
+        "counter",
+        "Cache lookups that found an entry.",
+        "hits",
+    ),
+    (
+        "movie_api_cache_misses_total",
+        "counter",
+        "Cache lookups that found nothing.",
+        "misses",
+    ),
+    (
+        "movie_api_cache_hit_ratio",
+        "gauge",
+        "Hits over lookups since start.",
+        "hit_ratio",
+    ),
+    ("movie_api_cache_entries", "gauge", "Entries held.", "size"),
+)
+
+
+def _cache_lines() -> list:
+    stats = {name: cache.stats() for name, cache in CACHES.items()}
+    lines = []
+    for metric, kind, documentation, key in CACHE_METRICS:
+        lines += [f"# HELP {metric} {documentation}", f"# TYPE {metric} {kind}"]
+        for name, values in stats.items():
+            lines.append(f"{metric}{_labels(('cache',), (name,))} {values[key]}")
+    return lines
+
+
+def render() -> bytes:
+    """Every metric in Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _cache_lines()
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def instrument_engine(engine):
+    """
+    Times every query run on `engine` (for an AsyncEngine, pass its
+    sync_engine). Queries made while handling a request also count toward
+    its Server-Timing "db" entry.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        seconds = time.perf_counter() - context._metrics_started
+        DB_QUERY_SECONDS.observe(seconds)
+        timings = _current_request.get()
+        if timings is not None:
+            timings.db_queries += 1
+            timings.db_seconds += seconds
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request: records the request metrics
+    and adds the Server-Timing header with the stages the request went
+    through. Pure ASGI, so endpoints run in the task that set the timings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_request.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_HEADER:
+                    header = timings.header(time.perf_counter() - started)
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", ()),
+                            (b"server-timing", header.encode("latin-1")),
+                        ],
+                    }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _current_request.reset(token)
+            # The route template, so /movies/similar/{movie_id} is one series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], route
+            )
+            REQUESTS.inc(scope["method"], route, str(status))
+            DB_QUERIES_PER_REQUEST.observe(timings.db_queries)
@@ -7,6 +7,7 @@ from sqlalchemy import (
     Date,
     ForeignKey,
     UniqueConstraint,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
@@ -35,10 +36,10 @@ class Movie(Base):
     genres = Column(ARRAY(Integer))
     poster_path = Column(String(255))
     backdrop_path = Column(String(255))
-    popularity = Column(Float)
-    vote_average = Column(Float)
+    popularity = Column(Float, index=True)
+    vote_average = Column(Float, index=True)
     vote_count = Column(Integer)
-    release_date = Column(Date, nullable=True)
+    release_date = Column(Date, nullable=True, index=True)
     runtime = Column(Integer, nullable=True)
     trailer_key = Column(String(255))
 
@@ -47,6 +48,10 @@ class Movie(Base):
         "MovieCategory", back_populates="movie", cascade="all, delete-orphan"
     )
 
+    # GIN index so genre containment (genres @> ARRAY[...]) avoids a full scan;
+    # existing databases get these from scripts/add_movie_indexes.py
+    __table_args__ = (Index("ix_movies_genres", "genres", postgresql_using="gin"),)
+
     def __repr__(self):
         return f"<Movie(id={self.id}, title='{self.title}')>"
 
@@ -83,8 +88,19 @@ class Favorite(Base):
     user = relationship("User", back_populates="favorites")
     movie = relationship("Movie", back_populates="favorited_by_users")
 
-    # Prevent a user from favoriting the same movie multiple times
-    __table_args__ = (UniqueConstraint("user_id", "movie_id", name="_user_movie_uc"),)
+    __table_args__ = (
+        # Prevent a user from favoriting the same movie multiple times
+        UniqueConstraint("user_id", "movie_id", name="_user_movie_uc"),
+        # A user's favorites newest first, paged by id (keyset pagination)
+        Index("ix_favorites_user_id_id", "user_id", "id"),
+    )
+
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    # Single row, bumped by the ingestion scripts (see response_cache.py)
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 
 if __name__ == "__main__":
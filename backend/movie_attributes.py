@@ -0,0 +1,207 @@
+import os
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Movie, Genre
+from embedding_builder import stream_movies
+
+MOVIE_ATTRIBUTES_FILE = "movie_attributes.npz"
+# One bit per genre in a uint64
+MAX_GENRES = 64
+
+
+class MovieFilters:
+    """
+    Metadata constraints and score blend of one semantic query. Unset
+    constraints do not filter; a movie with an unknown value fails any
+    constraint on it.
+    """
+
+    def __init__(
+        self,
+        genres=None,
+        year_from: int = None,
+        year_to: int = None,
+        max_runtime: int = None,
+        min_rating: float = None,
+        popularity_weight: float = 0.0,
+        rating_weight: float = 0.0,
+    ):
+        # Movies must have every listed genre
+        self.genres = list(genres or [])
+        self.year_from = year_from
+        self.year_to = year_to
+        self.max_runtime = max_runtime
+        self.min_rating = min_rating
+        # Added to the cosine score: weight * popularity or rating in [0, 1]
+        self.popularity_weight = popularity_weight
+        self.rating_weight = rating_weight
+
+    def __bool__(self):
+        return self.filters_rows or self.blends
+
+    @property
+    def filters_rows(self) -> bool:
+        return bool(self.genres) or any(
+            value is not None
+            for value in (
+                self.year_from,
+                self.year_to,
+                self.max_runtime,
+                self.min_rating,
+            )
+        )
+
+    @property
+    def blends(self) -> bool:
+        return self.popularity_weight > 0 or self.rating_weight > 0
+
+
+class MovieAttributes:
+    """
+    Filterable metadata of a snapshot as NumPy columns aligned with its
+    embedding rows, so a filter is one vectorized mask over every movie.
+
+    `genre_bits[row]` has bit i set when the movie has genre `genre_ids[i]`.
+    Unknown release years and runtimes are 0, unknown ratings and popularity
+    NaN. Values are as of the snapshot build, like the embeddings.
+    """
+
+    def __init__(
+        self,
+        genre_ids: np.ndarray,
+        genre_bits: np.ndarray,
+        release_year: np.ndarray,
+        runtime: np.ndarray,
+        vote_average: np.ndarray,
+        popularity: np.ndarray,
+    ):
+        self.genre_ids = genre_ids
+        self.genre_bits = genre_bits
+        self.release_year = release_year
+        self.runtime = runtime
+        self.vote_average = vote_average
+        self.popularity = popularity
+        self.genre_bit = {int(gid): bit for bit, gid in enumerate(genre_ids)}
+
+        # Blend features in [0, 1]; popularity is heavy-tailed, hence the log
+        log_popularity = np.log1p(np.nan_to_num(popularity))
+        top = log_popularity.max() if len(log_popularity) else 0.0
+        self.popularity_score = (
+            log_popularity / top if top > 0 else log_popularity
+        ).astype(np.float32)
+        self.rating_score = (np.nan_to_num(vote_average) / 10).astype(np.float32)
+
+    def __len__(self):
+        return len(self.genre_bits)
+
+    def exclude_mask(self, filters: MovieFilters) -> np.ndarray:
+        """Boolean row mask, True for movies the filters rule out."""
+        keep = np.ones(len(self), dtype=bool)
+        if filters.genres:
+            # No movie has a genre the catalog does not know
+            if any(gid not in self.genre_bit for gid in filters.genres):
+                return np.ones(len(self), dtype=bool)
+            wanted = np.uint64(sum(1 << self.genre_bit[gid] for gid in filters.genres))
+            keep &= (self.genre_bits & wanted) == wanted
+        if filters.year_from is not None:
+            keep &= self.release_year >= filters.year_from
+        if filters.year_to is not None:
+            keep &= (self.release_year > 0) & (self.release_year <= filters.year_to)
+        if filters.max_runtime is not None:
+            keep &= (self.runtime > 0) & (self.runtime <= filters.max_runtime)
+        if filters.min_rating is not None:
+            # NaN compares False, so unrated movies drop out
+            keep &= self.vote_average >= filters.min_rating
+        return ~keep
+
+    def boost(self, filters: MovieFilters):
+        """Per-row score bonus of the popularity/rating blend, or None."""
+        if not filters.blends:
+            return None
+        return (
+            filters.popularity_weight * self.popularity_score
+            + filters.rating_weight * self.rating_score
+        ).astype(np.float32)
+
+    def save(self, directory: str):
+        path = os.path.join(directory, MOVIE_ATTRIBUTES_FILE)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            genre_ids=self.genre_ids,
+            genre_bits=self.genre_bits,
+            release_year=self.release_year,
+            runtime=self.runtime,
+            vote_average=self.vote_average,
+            popularity=self.popularity,
+        )
+        os.replace(tmp_path, path)
+
+
+def load_movie_attributes(directory: str):
+    """Loads a snapshot's attribute columns, or returns None if it has none."""
+    path = os.path.join(directory, MOVIE_ATTRIBUTES_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return MovieAttributes(
+            data["genre_ids"],
+            data["genre_bits"],
+            data["release_year"],
+            data["runtime"],
+            data["vote_average"],
+            data["popularity"],
+        )
+
+
+def build_movie_attributes(db: Session, directory: str, store) -> MovieAttributes:
+    """
+    Mirrors the filterable columns of the movies table into the row order of
+    `store`, streaming the rows, and saves them into the snapshot directory.
+    """
+    genre_ids = np.array(sorted(db.scalars(select(Genre.id)).all()), dtype=np.int32)
+    if len(genre_ids) > MAX_GENRES:
+        print(f"Only the first {MAX_GENRES} of {len(genre_ids)} genres are filterable")
+        genre_ids = genre_ids[:MAX_GENRES]
+    genre_bit = {int(gid): bit for bit, gid in enumerate(genre_ids)}
+
+    n_rows = len(store)
+    genre_bits = np.zeros(n_rows, dtype=np.uint64)
+    release_year = np.zeros(n_rows, dtype=np.int16)
+    # int32: TMDB lists experimental films running past int16's 32767 minutes
+    runtime = np.zeros(n_rows, dtype=np.int32)
+    vote_average = np.full(n_rows, np.nan, dtype=np.float32)
+    popularity = np.full(n_rows, np.nan, dtype=np.float32)
+
+    result = stream_movies(
+        db,
+        Movie.id,
+        Movie.genres,
+        Movie.release_date,
+        Movie.runtime,
+        Movie.vote_average,
+        Movie.popularity,
+    )
+    for partition in result.partitions():
+        rows = store.rows_of([movie.id for movie in partition])
+        for row, movie in zip(rows.tolist(), partition):
+            # Movies added after the embeddings were built have no row yet
+            if row < 0:
+                continue
+            genre_bits[row] = sum(
+                1 << genre_bit[gid] for gid in (movie.genres or []) if gid in genre_bit
+            )
+            if movie.release_date is not None:
+                release_year[row] = movie.release_date.year
+            runtime[row] = movie.runtime or 0
+            if movie.vote_average is not None:
+                vote_average[row] = movie.vote_average
+            if movie.popularity is not None:
+                popularity[row] = movie.popularity
+
+    attributes = MovieAttributes(
+        genre_ids, genre_bits, release_year, runtime, vote_average, popularity
+    )
+    attributes.save(directory)
+    return attributes
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+
+# Neighbours materialized per movie; 0 disables the table (always score live)
+NEIGHBOR_TABLE_K = int(os.getenv("NEIGHBOR_TABLE_K", "100"))
+# Scratch memory for one block of the build (rows x catalog scores plus
+# argpartition's indices); the rows per block follow from the catalog size
+NEIGHBOR_BUILD_MEMORY_MB = int(os.getenv("NEIGHBOR_BUILD_MEMORY_MB", "256"))
+# float32 score + int64 partition index per (row, movie) pair
+BYTES_PER_SCORE = 12
+
+NEIGHBORS_FILE = "neighbors.npy"
+NEIGHBOR_SCORES_FILE = "neighbor_scores.npy"
+
+
+class NeighborTable:
+    """
+    Precomputed top-K neighbours of every row of a snapshot.
+
+    `rows[i]` holds the neighbour rows of row i, best first (int32, -1 pads
+    rows with fewer than K neighbours) and `scores[i]` their cosine scores
+    (float16). A row is never its own neighbour.
+    """
+
+    def __init__(self, rows: np.ndarray, scores: np.ndarray):
+        self.rows = rows
+        self.scores = scores
+
+    @property
+    def k(self):
+        return self.rows.shape[1]
+
+    def lookup(self, row: int, k: int, exclude=None):
+        """
+        The k nearest rows of `row` minus `exclude`, or None when the table
+        cannot answer (too few neighbours stored) and live scoring is needed.
+        """
+        neighbors = self.rows[row]
+        neighbors = neighbors[neighbors >= 0]
+        if exclude is not None and len(exclude):
+            neighbors = neighbors[~np.isin(neighbors, exclude)]
+        if len(neighbors) < k:
+            return None
+        return neighbors[:k]
+
+
+def build_neighbor_table(directory: str, embeddings: np.ndarray, index, k=None):
+    """
+    Computes and saves the neighbour table of a snapshot. Exact for the
+    brute-force index (blocked matrix products), approximate through the
+    index otherwise. Returns None when the table is disabled.
+    """
+    k = min(k or NEIGHBOR_TABLE_K, len(embeddings) - 1)
+    if k <= 0:
+        return None
+
+    print(f"Precomputing {k} neighbours for {len(embeddings)} movies...")
+    if index.kind == "brute":
+        rows, scores = _exact_neighbors(embeddings, k)
+    else:
+        rows, scores = _index_neighbors(embeddings, index, k)
+
+    np.save(os.path.join(directory, NEIGHBORS_FILE), rows)
+    np.save(os.path.join(directory, NEIGHBOR_SCORES_FILE), scores)
+    return load_neighbor_table(directory)
+
+
+def load_neighbor_table(directory: str):
+    """Memory-maps a snapshot's neighbour table, or returns None if it has none."""
+    rows_path = os.path.join(directory, NEIGHBORS_FILE)
+    scores_path = os.path.join(directory, NEIGHBOR_SCORES_FILE)
+    if not os.path.exists(rows_path) or not os.path.exists(scores_path):
+        return None
+    return NeighborTable(
+        np.load(rows_path, mmap_mode="r"), np.load(scores_path, mmap_mode="r")
+    )
+
+
+def build_block_size(n_rows: int, memory_mb: int = None) -> int:
+    """Rows scored per matrix product so one block fits the memory budget."""
+    budget = (memory_mb or NEIGHBOR_BUILD_MEMORY_MB) * 1024 * 1024
+    return int(min(n_rows, max(1, budget // (n_rows * BYTES_PER_SCORE))))
+
+
+def _exact_neighbors(embeddings: np.ndarray, k: int):
+    n_rows = len(embeddings)
+    rows = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float16)
+    block_size = build_block_size(n_rows)
+
+    for start in range(0, n_rows, block_size):
+        block = np.asarray(embeddings[start : start + block_size])
+        block_scores = block @ embeddings.T
+        # A movie is not its own neighbour
+        own = np.arange(len(block))
+        block_scores[own, start + own] = -np.inf
+
+        top = np.argpartition(block_scores, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(block_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        end = start + len(block)
+        rows[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+    return rows, scores
+
+
+def _index_neighbors(embeddings: np.ndarray, index, k: int):
+    n_rows = len(embeddings)
+    rows = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float16)
+    block_size = build_block_size(n_rows)
+
+    for start in range(0, n_rows, block_size):
+        block = np.asarray(embeddings[start : start + block_size])
+        # One extra result per query stands in for the row itself
+        found, found_scores = index.search_batch(block, k + 1)
+        for row, neighbors, neighbor_scores in zip(
+            range(start, start + len(block)), found, found_scores
+        ):
+            keep = neighbors != row
+            neighbors, neighbor_scores = neighbors[keep][:k], neighbor_scores[keep][:k]
+            rows[row, : len(neighbors)] = neighbors
+            scores[row, : len(neighbors)] = neighbor_scores
+
+    return rows, scores
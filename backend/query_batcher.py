@@ -0,0 +1,115 @@
+import os
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+
+# How long the first query of a batch waits for company, and the batch cap
+BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+# Queries allowed to wait at once before new ones are shed
+BATCH_MAX_QUEUE = int(os.getenv("QUERY_BATCH_MAX_QUEUE", "256"))
+
+
+class QueueFullError(Exception):
+    """Raised when the batcher is saturated and the query should be rejected."""
+
+
+class BatcherStoppedError(Exception):
+    """Raised for queries still waiting when the batcher is stopped."""
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent queries into batches for a single worker call.
+
+    Queries that arrive within `window_ms` of the first waiting one (up to
+    `max_batch`) are handed together to `process_batch(texts) -> results`,
+    which runs in the threadpool so the event loop stays free. Duplicate texts
+    in a batch are processed once. When `max_queue` queries are already
+    waiting, `submit` raises QueueFullError instead of growing the backlog;
+    queries still waiting when `stop` is called get BatcherStoppedError.
+    """
+
+    def __init__(
+        self,
+        process_batch,
+        window_ms: float = BATCH_WINDOW_MS,
+        max_batch: int = BATCH_MAX_SIZE,
+        max_queue: int = BATCH_MAX_QUEUE,
+    ):
+        self.process_batch = process_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        # The batch being collected or processed by the worker
+        self._batch = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Fail the interrupted batch and everything queued behind it instead
+        # of leaving their callers waiting forever
+        pending = self._batch
+        self._batch = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(
+                    BatcherStoppedError("Query batcher is shutting down")
+                )
+
+    async def submit(self, text: str):
+        if self._worker is None:
+            # Not started (e.g. called outside the app lifecycle): no batching
+            return (await run_in_threadpool(self.process_batch, [text]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            raise QueueFullError("Too many queries waiting to be encoded")
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._process(batch)
+            self._batch = []
+
+    async def _process(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            results = await run_in_threadpool(self.process_batch, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, results))
+        for text, future in batch:
+            # The caller may have gone away (client disconnect cancels the future)
+            if not future.done():
+                future.set_result(by_text[text])
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int, exclude=None) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first.
+
+    Uses argpartition to find the k winners in O(N) and only sorts those k,
+    instead of argsorting every score. `exclude` is either a boolean mask over
+    `scores` or a sequence of positions (e.g. the seed movie or the user's
+    favorites) that must never be returned.
+    """
+    scores = np.asarray(scores)
+    if exclude is None:
+        return _partition_top_k(scores, k)
+
+    exclude = np.asarray(exclude)
+    if exclude.dtype == bool:
+        candidates = np.flatnonzero(~exclude)
+        return candidates[_partition_top_k(scores[candidates], k)]
+
+    # A handful of excluded positions: over-fetch and drop them, no copy of scores
+    top = _partition_top_k(scores, k + len(exclude))
+    return top[~np.isin(top, exclude)][:k]
+
+
+def _partition_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
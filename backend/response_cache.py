@@ -0,0 +1,177 @@
+import os
+import time
+import hashlib
+import orjson
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from models import CatalogVersion
+from query_cache import QueryCache
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# How long a worker trusts its last read of the catalog version
+CATALOG_VERSION_POLL_SECONDS = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "5"))
+# Optional shared backend (e.g. redis://localhost:6379/0) so workers warm each other
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+
+CATALOG_VERSION_ID = 1
+
+
+def bump_catalog_version(db: Session):
+    """
+    Marks the catalog as changed, retiring every cached catalog response.
+    Called by the ingestion scripts after they commit.
+    """
+    db.execute(
+        insert(CatalogVersion)
+        .values(id=CATALOG_VERSION_ID, version=1)
+        .on_conflict_do_update(
+            index_elements=[CatalogVersion.id],
+            set_={"version": CatalogVersion.version + 1},
+        )
+    )
+    db.commit()
+
+
+def serialize(content) -> bytes:
+    """Compact JSON for plain dicts and lists (movie cards, not ORM objects)."""
+    return orjson.dumps(content)
+
+
+def serialize_items(items) -> bytes:
+    """
+    One compact JSON document per line, so a list can be cached as a single
+    blob and still be sliced without parsing (JSON never holds a raw newline).
+    """
+    return b"\n".join(serialize(item) for item in items)
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def json_response(request: Request, body: bytes, etag: str = None) -> Response:
+    """A JSON response for `body`, or a bodiless 304 if the client has it already."""
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class CachedBody:
+    """A serialized response body and its ETag."""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = make_etag(body)
+
+    def items(self) -> list:
+        """The documents of a body written by serialize_items."""
+        return self.body.split(b"\n") if self.body else []
+
+
+class RedisBackend:
+    """Shared body store; failures degrade to the in-process cache and the DB."""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RESPONSE_CACHE_REDIS_URL needs `pip install redis`"
+            ) from e
+        self.client = redis.from_url(url)
+        self.ttl = max(1, int(ttl))
+
+    async def get(self, key: str):
+        try:
+            return await self.client.get(key)
+        except Exception as e:
+            print(f"Response cache backend unavailable: {e}")
+            return None
+
+    async def set(self, key: str, body: bytes):
+        try:
+            await self.client.set(key, body, ex=self.ttl)
+        except Exception as e:
+            print(f"Response cache backend unavailable: {e}")
+
+
+class ResponseCache:
+    """
+    Pre-serialized JSON bodies of the catalog endpoints.
+
+    Entries belong to the catalog version they were built from. Each worker
+    re-reads the version at most every CATALOG_VERSION_POLL_SECONDS and drops
+    its entries when it moved; shared entries carry the version in their key,
+    so old ones are simply never read again and expire on their own.
+    """
+
+    def __init__(
+        self,
+        max_size: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        redis_url: str = RESPONSE_CACHE_REDIS_URL,
+    ):
+        self.local = QueryCache(max_size, ttl)
+        self.shared = RedisBackend(redis_url, ttl) if redis_url else None
+        self.version = None
+        self._checked_at = 0.0
+
+    async def catalog_version(self, db) -> int:
+        now = time.monotonic()
+        if (
+            self.version is None
+            or now - self._checked_at >= CATALOG_VERSION_POLL_SECONDS
+        ):
+            version = await db.scalar(
+                select(CatalogVersion.version).where(
+                    CatalogVersion.id == CATALOG_VERSION_ID
+                )
+            )
+            version = version or 0
+            if version != self.version:
+                self.local.clear()
+            self.version = version
+            self._checked_at = now
+        return self.version
+
+    async def get_or_load(self, db, key: str, load, serializer=serialize):
+        """
+        The CachedBody for `key`; on a miss the content of `await load()` is
+        serialized once and cached for every later request.
+        """
+        version = await self.catalog_version(db)
+        # A load that overlaps a version change must not be cached locally
+        generation = self.local.generation
+        cached = self.local.get(key)
+        if cached is not None:
+            return cached
+
+        shared_key = f"catalog:{version}:{key}"
+        body = await self.shared.get(shared_key) if self.shared else None
+        if body is None:
+            body = serializer(await load())
+            if self.shared:
+                await self.shared.set(shared_key, body)
+
+        cached = CachedBody(body)
+        self.local.put(key, cached, generation)
+        return cached
+
+    def stats(self) -> dict:
+        return {
+            **self.local.stats(),
+            "catalog_version": self.version,
+            "shared_backend": self.shared is not None,
+        }
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field
+from datetime import date
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
 class UserCreate(BaseModel):
@@ -13,3 +14,73 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: str | None = None
+
+
+class MovieCard(BaseModel):
+    """What a carousel or grid card shows; every list endpoint returns these."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    poster_path: str | None = None
+    vote_average: float | None = None
+    release_date: date | None = None
+    genres: list[int] | None = None
+
+
+class MovieDetail(MovieCard):
+    """The full movie, for the detail modal (/movies/{movie_id})."""
+
+    tmdb_id: int
+    overview: str | None = None
+    backdrop_path: str | None = None
+    popularity: float | None = None
+    vote_count: int | None = None
+    runtime: int | None = None
+    trailer_key: str | None = None
+
+
+class GenreRow(BaseModel):
+    genre_name: str
+    movies: list[MovieCard]
+
+
+class RankedMovies(BaseModel):
+    results: list[MovieCard]
+    index_version: str
+
+
+class MoodMovies(BaseModel):
+    movies: list[MovieCard]
+    index_version: str
+
+
+class SimilarMovies(BaseModel):
+    similar_movies: list[MovieCard]
+    index_version: str
+
+
+class FavoriteMovies(BaseModel):
+    favorites: list[MovieCard]
+    # Pass as `cursor` to get the next page; None on the last page
+    next_cursor: int | None = None
+
+
+class FavoriteStatus(BaseModel):
+    favorited: bool
+
+
+class FavoriteCount(BaseModel):
+    count: int
+
+
+class Recommendation(BaseModel):
+    base_movie: MovieCard
+    similar_movies: list[MovieCard]
+
+
+class PersonalizedRecommendations(BaseModel):
+    recommendations: list[Recommendation]
+    for_you: list[MovieCard]
+    index_version: str
@@ -0,0 +1,55 @@
+from sqlalchemy import text
+from database import engine
+from models import Movie, Favorite
+
+# Tables whose models.py indexes may be missing from older databases
+INDEXED_TABLES = [Movie.__table__, Favorite.__table__]
+
+
+def index_statements():
+    """CREATE INDEX CONCURRENTLY for every index models.py declares on them."""
+    for table in INDEXED_TABLES:
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            using = index.dialect_options["postgresql"]["using"]
+            method = f" USING {using}" if using else ""
+            columns = ", ".join(column.name for column in index.columns)
+            yield index.name, (
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+                f"ON {table.name}{method} ({columns})"
+            )
+
+
+def add_movie_indexes():
+    """
+    Adds the movies and favorites indexes to a database created before they
+    were declared.
+    Builds them concurrently, so the API keeps serving (and ingestion keeps
+    writing) while it runs; safe to re-run.
+    """
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, statement in index_statements():
+            # An interrupted concurrent build leaves an invalid index behind,
+            # which IF NOT EXISTS would otherwise keep forever
+            invalid = conn.scalar(
+                text(
+                    "SELECT NOT i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+                ),
+                {"name": name},
+            )
+            if invalid:
+                print(f"Dropping invalid index {name}...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            print(f"Creating {name}...")
+            conn.execute(text(statement))
+
+        # Fresh statistics so the planner starts using the new indexes
+        for table in INDEXED_TABLES:
+            conn.execute(text(f"ANALYZE {table.name}"))
+    print("Indexes are up to date!")
+
+
+if __name__ == "__main__":
+    add_movie_indexes()
@@ -1,50 +1,84 @@
-import os, time, requests
-from dotenv import load_dotenv
-from database import SessionLocal
+import os
+import asyncio
+from sqlalchemy import select, update, values, column, Integer, String
+from database import AsyncSessionLocal
 from models import Movie
+from scripts.tmdb import TmdbClient, Progress, pick_trailer_key
 
-load_dotenv()
-API_KEY = os.getenv("TMDB_API_KEY")
+# Trailer keys written per UPDATE ... FROM (VALUES ...) statement
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "500"))
 
 
-def enrich_trailers():
-    db = SessionLocal()
-    # Fetch all movies missing keys at once so we don't keep querying the DB
-    movies = db.query(Movie).filter(Movie.trailer_key == None).all()
-    print(f"Processing {len(movies)} movies. Go grab a coffee!")
-
-    for movie in movies:
-        url = f"https://api.themoviedb.org/3/movie/{movie.tmdb_id}/videos?api_key={API_KEY}"
-        try:
-            response = requests.get(url, timeout=5)
-
-            if response.status_code == 200:
-                videos = response.json().get("results", [])
-                # Default to N/A if no trailer is found
-                movie.trailer_key = next(
-                    (
-                        v["key"]
-                        for v in videos
-                        if v["site"] == "YouTube" and v["type"] == "Trailer"
-                    ),
-                    "N/A",
-                )
-            elif response.status_code == 429:
-                print("Rate limit! Sleeping 10s...")
-                time.sleep(10)
-                continue
+async def fetch_trailer(client: TmdbClient, movie_id: int, tmdb_id: int):
+    """(movie id, trailer key); "N/A" when TMDB has no trailer, None on failure."""
+    try:
+        return movie_id, pick_trailer_key(await client.get(f"/movie/{tmdb_id}/videos"))
+    except Exception as e:
+        print(f"Error for TMDB movie {tmdb_id}: {e}")
+        return movie_id, None
+
+
+async def write_trailers(db, trailers: list):
+    """Sets the trailer key of many movies with one UPDATE ... FROM (VALUES ...)."""
+    rows = values(
+        column("id", Integer), column("trailer_key", String), name="trailers"
+    ).data(trailers)
+    await db.execute(
+        update(Movie)
+        .where(Movie.id == rows.c.id)
+        .values(trailer_key=rows.c.trailer_key)
+    )
+    await db.commit()
+
+
+async def enrich_trailers_async():
+    """
+    Backfills trailer keys for movies ingested without one. New ingestion runs
+    fetch trailers together with the details, so this only catches up on
+    older rows and failed lookups; rows that fail again stay NULL for next time.
+    Carousel cards carry no trailer, so the catalog version is left alone.
+    """
+    progress = Progress()
+    async with AsyncSessionLocal() as db, TmdbClient() as client:
+        movies = (
+            await db.execute(
+                select(Movie.id, Movie.tmdb_id).where(Movie.trailer_key.is_(None))
+            )
+        ).all()
+        print(f"Processing {len(movies)} movies")
+
+        pending = []
+        lookups = [
+            fetch_trailer(client, movie_id, tmdb_id) for movie_id, tmdb_id in movies
+        ]
+        for done, lookup in enumerate(asyncio.as_completed(lookups), start=1):
+            movie_id, trailer_key = await lookup
+            if trailer_key is None:
+                progress.add("failed")
             else:
-                movie.trailer_key = "N/A"
+                pending.append((movie_id, trailer_key))
+
+            if pending and (len(pending) >= ENRICH_BATCH_SIZE or done == len(movies)):
+                try:
+                    await write_trailers(db, pending)
+                    progress.add("movies", len(pending))
+                except Exception as e:
+                    await db.rollback()
+                    print(f"Failed to write {len(pending)} trailers: {e}")
+                pending = []
+                print(
+                    f"{done}/{len(movies)} movies: {progress.report()} "
+                    f"at {client.bucket.rate:.1f} req/s"
+                )
 
-            db.commit()
-            print(f"Done: {movie.title}")
-            time.sleep(0.25)  # Safe pace
+        for name, count in client.counters().items():
+            progress.add(name, count)
 
-        except Exception as e:
-            print(f"Error for {movie.title}: {e}")
-            db.rollback()
+    print(f"\nTrailer backfill completed! {progress.report()}")
 
-    db.close()
+
+def enrich_trailers():
+    asyncio.run(enrich_trailers_async())
 
 
 if __name__ == "__main__":
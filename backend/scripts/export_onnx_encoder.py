@@ -0,0 +1,6 @@
+import sys
+from encoders import export_onnx
+
+if __name__ == "__main__":
+    # Pass --no-quantize to only write the fp32 graph
+    export_onnx(quantize="--no-quantize" not in sys.argv)
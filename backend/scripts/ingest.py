@@ -1,102 +1,325 @@
 import os
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from dotenv import load_dotenv
-from database import SessionLocal
+import sys
+import json
+import asyncio
+from datetime import date, datetime
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from database import AsyncSessionLocal
 from models import Movie, MovieCategory
-
-load_dotenv()
-API_KEY = os.getenv("TMDB_API_KEY")
+from response_cache import bump_catalog_version
+from scripts.tmdb import TmdbClient, Progress, pick_trailer_key
 
 CATEGORY_LIMITS = {"now_playing": 10, "popular": 100, "top_rated": 450, "upcoming": 10}
 
+# Movies per INSERT ... ON CONFLICT statement
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+# Print a progress line every this many pages
+PROGRESS_EVERY_PAGES = 25
+# Filled from the detail request, only for movies that still miss them
+DETAIL_COLUMNS = ("runtime", "trailer_key")
+# Stands in for the detail response of a movie TMDB answers 404 for: runtime 0
+# (unknown) and trailer "N/A", so the movie counts as complete on later runs
+MISSING_DETAILS = {"runtime": 0, "videos": None}
+# Committed pages of an unfinished run (see IngestCheckpoint)
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint.json")
+# Extra passes over failed pages before leaving them to the next run
+RETRY_ROUNDS = 2
+RETRY_ROUND_DELAY_SECONDS = 30
+
+
+class IngestCheckpoint:
+    """
+    The pages of the current run that are committed to the database, and
+    the last error of those that are not, saved to INGEST_CHECKPOINT_PATH
+    after every batch. A run that crashes or leaves pages failing is resumed
+    from it; a run that completes deletes it, so the next one is a full
+    refresh.
+    """
+
+    def __init__(self, path=INGEST_CHECKPOINT_PATH, started_at=None, completed=None):
+        self.path = path
+        self.started_at = started_at or datetime.now().isoformat()
+        self.completed = completed or {}
+        self.failed = {}
+
+    @classmethod
+    def load(cls, path=INGEST_CHECKPOINT_PATH):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        completed = {
+            category: set(pages) for category, pages in state["completed"].items()
+        }
+        return cls(path, state["started_at"], completed)
+
+    def pages_done(self) -> int:
+        return sum(len(pages) for pages in self.completed.values())
+
+    def is_done(self, category: str, page: int) -> bool:
+        return page in self.completed.get(category, ())
+
+    def mark_done(self, pages):
+        for category, page in pages:
+            self.completed.setdefault(category, set()).add(page)
+            self.failed.get(category, {}).pop(page, None)
+
+    def mark_failed(self, category: str, page: int, error: str):
+        self.failed.setdefault(category, {})[page] = error
+
+    def save(self):
+        state = {
+            "started_at": self.started_at,
+            "completed": {c: sorted(pages) for c, pages in self.completed.items()},
+            "failed": self.failed,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
 
-def get_http_session():
-    """Creates a requests session with automatic retries."""
-    session = requests.Session()
-    retries = Retry(
-        total=5,
-        backoff_factor=1,  # Waits 1s, 2s, 4s... between retries
-        status_forcelist=[429, 500, 502, 503, 504],
+    def finish(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def parse_release_date(value):
+    """TMDB's "YYYY-MM-DD" as a date; asyncpg will not cast strings for Date columns."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def movie_row(movie_data: dict, details=None) -> dict:
+    """A movies row from a list result, plus runtime and trailer if `details`."""
+    return {
+        "tmdb_id": movie_data["id"],
+        "title": movie_data["title"],
+        "overview": movie_data["overview"],
+        "genres": movie_data["genre_ids"],
+        "poster_path": movie_data.get("poster_path"),
+        "backdrop_path": movie_data.get("backdrop_path"),
+        "popularity": movie_data.get("popularity"),
+        "vote_average": movie_data.get("vote_average"),
+        "vote_count": movie_data.get("vote_count"),
+        "release_date": parse_release_date(movie_data.get("release_date")),
+        # 0 when TMDB has no runtime, so the movie is not fetched again
+        "runtime": (details.get("runtime") or 0) if details else None,
+        "trailer_key": pick_trailer_key(details.get("videos")) if details else None,
+    }
+
+
+async def fetch_page(
+    client: TmdbClient, category: str, page: int, complete: set, data=None
+):
+    """
+    One list page (unless already fetched as `data`) plus, concurrently, the
+    details of every movie on it still missing its runtime or trailer; one
+    request returns both (append_to_response=videos). Movies whose details
+    are fetched, or that TMDB no longer knows (404), join `complete`.
+    Returns the movie rows.
+    """
+    if data is None:
+        data = await client.get(f"/movie/{category}", language="en-US", page=page)
+    results = (data or {}).get("results", [])
+
+    missing = [m["id"] for m in results if m["id"] not in complete]
+    details = await asyncio.gather(
+        *(
+            client.get(f"/movie/{tmdb_id}", append_to_response="videos")
+            for tmdb_id in missing
+        ),
+        return_exceptions=True,
     )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    return session
+    # Failed requests (exceptions) are left out and retried on a later run
+    details = {
+        tmdb_id: MISSING_DETAILS if detail is None else detail
+        for tmdb_id, detail in zip(missing, details)
+        if detail is None or isinstance(detail, dict)
+    }
+    # Also skips the detail request when another page lists the same movie
+    complete.update(details)
+
+    return [movie_row(m, details.get(m["id"])) for m in results]
 
 
-def ingest_movies():
+async def write_batch(db, movies: dict, links: set) -> int:
+    """
+    Upserts a batch of movies and their category links with two statements.
+    Existing movies get fresh list data; a stored runtime or trailer is kept
+    when the batch has none.
+    """
+    stmt = insert(Movie).values(list(movies.values()))
+    updated = {
+        column: stmt.excluded[column]
+        for column in movies[next(iter(movies))]
+        if column not in ("tmdb_id", *DETAIL_COLUMNS)
+    }
+    for column in DETAIL_COLUMNS:
+        updated[column] = func.coalesce(stmt.excluded[column], getattr(Movie, column))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Movie.tmdb_id], set_=updated
+    ).returning(Movie.tmdb_id, Movie.id)
+    movie_ids = dict((await db.execute(stmt)).tuples().all())
+
+    link_rows = [
+        {"movie_id": movie_ids[tmdb_id], "category_name": category}
+        for tmdb_id, category in links
+    ]
+    await db.execute(insert(MovieCategory).values(link_rows).on_conflict_do_nothing())
+    await db.commit()
+    return len(movies)
+
+
+async def ingest_pages(db, client: TmdbClient, pages: list, context: dict) -> list:
+    """
+    Fetches `pages` concurrently (bounded by the client) while finished ones
+    are written in batches; each batch checkpoints its pages once committed.
+    Returns the pages that failed to fetch or to write.
+    """
+    checkpoint, progress = context["checkpoint"], context["progress"]
+
+    async def fetch(category, page):
+        try:
+            data = context["first_pages"].get(category) if page == 1 else None
+            rows = await fetch_page(client, category, page, context["complete"], data)
+            return category, page, rows, None
+        except Exception as e:
+            return category, page, [], e
+
+    failed = []
+    movies, links, batch_pages = {}, set(), []
+    done = 0
+    for next_page in asyncio.as_completed([fetch(c, p) for c, p in pages]):
+        category, page, rows, error = await next_page
+        done += 1
+        if error is not None:
+            print(f"Failed on {category} page {page}: {error}")
+            checkpoint.mark_failed(category, page, str(error))
+            failed.append((category, page))
+            progress.add("failed pages")
+        else:
+            for row in rows:
+                # A movie listed twice keeps the details fetched with either
+                previous = movies.get(row["tmdb_id"])
+                if previous:
+                    for column in DETAIL_COLUMNS:
+                        if row[column] is None:
+                            row[column] = previous[column]
+                movies[row["tmdb_id"]] = row
+                links.add((row["tmdb_id"], category))
+            batch_pages.append((category, page))
+            progress.add("pages")
+
+        last = done == len(pages)
+        if batch_pages and (len(movies) >= INGEST_BATCH_SIZE or last):
+            try:
+                if movies:
+                    progress.add("movies", await write_batch(db, movies, links))
+                checkpoint.mark_done(batch_pages)
+            except Exception as e:
+                await db.rollback()
+                print(f"Failed to write {len(movies)} movies: {e}")
+                for category, page in batch_pages:
+                    checkpoint.mark_failed(category, page, str(e))
+                failed.extend(batch_pages)
+            checkpoint.save()
+            movies, links, batch_pages = {}, set(), []
+
+        if done % PROGRESS_EVERY_PAGES == 0 or last:
+            print(f"{done}/{len(pages)} pages: {progress.report()}")
+
+    return failed
+
+
+async def ingest_movies_async(fresh=False):
     print("Starting ingestion...")
-    db = SessionLocal()
-    http = get_http_session()  # Use one session for all network calls
+    progress = Progress()
 
-    try:
+    checkpoint = None if fresh else IngestCheckpoint.load()
+    if checkpoint is not None:
+        print(
+            f"Resuming the run started {checkpoint.started_at} "
+            f"({checkpoint.pages_done()} pages already committed)"
+        )
+    else:
+        checkpoint = IngestCheckpoint()
+
+    async with AsyncSessionLocal() as db, TmdbClient() as client:
+        # Movies whose detail request can be skipped
+        complete = set(
+            (
+                await db.scalars(
+                    select(Movie.tmdb_id).where(
+                        Movie.runtime.isnot(None), Movie.trailer_key.isnot(None)
+                    )
+                )
+            ).all()
+        )
+
+        # Page 1 of each category also tells how many pages there really are
+        first_pages = await asyncio.gather(
+            *(
+                client.get(f"/movie/{category}", language="en-US", page=1)
+                for category in CATEGORY_LIMITS
+            ),
+            return_exceptions=True,
+        )
+        # A failed first page is simply fetched again with the others
+        first_pages = {
+            category: None if isinstance(first, Exception) else first
+            for category, first in zip(CATEGORY_LIMITS, first_pages)
+        }
+        pages = []
         for category, max_pages in CATEGORY_LIMITS.items():
-            print(f"\nCategory: {category}")
-            for page in range(1, max_pages + 1):
-                url = f"https://api.themoviedb.org/3/movie/{category}"
-                params = {"api_key": API_KEY, "language": "en-US", "page": page}
-
-                try:
-                    response = http.get(url, params=params)
-                    response.raise_for_status()
-                    movies_list = response.json().get("results", [])
-
-                    for movie_data in movies_list:
-                        tmdb_id = movie_data["id"]
-                        movie = db.query(Movie).filter(Movie.tmdb_id == tmdb_id).first()
-                        current_movie_runtime = None
-
-                        # Fetch details if new or missing runtime
-                        if not movie or movie.runtime is None:
-                            detail_url = f"https://api.themoviedb.org/3/movie/{tmdb_id}"
-                            d_resp = http.get(detail_url, params={"api_key": API_KEY})
-                            if d_resp.status_code == 200:
-                                current_movie_runtime = d_resp.json().get("runtime")
-
-                            if not movie:
-                                movie = Movie(
-                                    tmdb_id=tmdb_id,
-                                    title=movie_data["title"],
-                                    overview=movie_data["overview"],
-                                    genres=movie_data["genre_ids"],
-                                    poster_path=movie_data.get("poster_path"),
-                                    backdrop_path=movie_data.get("backdrop_path"),
-                                    popularity=movie_data.get("popularity"),
-                                    vote_average=movie_data.get("vote_average"),
-                                    vote_count=movie_data.get("vote_count"),
-                                    release_date=movie_data.get("release_date") or None,
-                                    runtime=current_movie_runtime,
-                                )
-                            db.add(movie)
-                            db.flush()
-                        else:
-                            if current_movie_runtime is not None:
-                                movie.runtime = current_movie_runtime
-
-                        # Category Mapping
-                        existing_link = (
-                            db.query(MovieCategory)
-                            .filter_by(movie_id=movie.id, category_name=category)
-                            .first()
-                        )
-
-                        if not existing_link:
-                            db.add(
-                                MovieCategory(movie_id=movie.id, category_name=category)
-                            )
-
-                    db.commit()  # Commit once per page
-                    print(f"Processed page {page}/{max_pages}")
-
-                except Exception as e:
-                    db.rollback()
-                    print(f"Failed on page {page}: {e}")
-
-    finally:
-        http.close()
-        db.close()
-        print("\nIngestion completed!")
+            total_pages = (first_pages[category] or {}).get("total_pages", max_pages)
+            pages.extend(
+                (category, p)
+                for p in range(1, min(max_pages, total_pages) + 1)
+                if not checkpoint.is_done(category, p)
+            )
+        print(f"Fetching {len(pages)} pages from {len(CATEGORY_LIMITS)} categories")
+
+        context = {
+            "checkpoint": checkpoint,
+            "progress": progress,
+            "complete": complete,
+            "first_pages": first_pages,
+        }
+        # Failed pages go back in the queue for a few rounds, with a pause
+        # in between for transient outages to clear
+        for attempt in range(RETRY_ROUNDS + 1):
+            if not pages:
+                break
+            if attempt:
+                print(f"Retrying {len(pages)} failed pages (round {attempt})...")
+                await asyncio.sleep(RETRY_ROUND_DELAY_SECONDS * attempt)
+            pages = await ingest_pages(db, client, pages, context)
+
+        if progress.counts.get("movies"):
+            # Retire the cached home feed carousels (see response_cache.py)
+            await db.run_sync(bump_catalog_version)
+
+        for name, count in client.counters().items():
+            progress.add(name, count)
+
+    if pages:
+        checkpoint.save()
+        print(
+            f"\n{len(pages)} pages still failing, kept in {checkpoint.path}; "
+            "the next run resumes with them"
+        )
+    else:
+        checkpoint.finish()
+    print(f"\nIngestion completed! {progress.report()}")
+
+
+def ingest_movies(fresh=False):
+    asyncio.run(ingest_movies_async(fresh))
 
 
 if __name__ == "__main__":
-    ingest_movies()
+    # --fresh ignores a saved checkpoint and refreshes every page
+    ingest_movies(fresh="--fresh" in sys.argv)
@@ -3,6 +3,7 @@ import requests
 from dotenv import load_dotenv
 from database import SessionLocal
 from models import Genre
+from response_cache import bump_catalog_version
 
 load_dotenv()
 API_KEY = os.getenv("TMDB_API_KEY")
@@ -34,6 +35,8 @@ def ingest_genres():
                 print(f"Skipping: {item['name']} (already exists)")
 
         db.commit()
+        # Genre discovery is cached per genre name
+        bump_catalog_version(db)
         print("Genre ingestion completed!")
     except Exception as e:
         print(f"An error occurred: {e}")
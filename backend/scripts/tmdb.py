@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+API_KEY = os.getenv("TMDB_API_KEY")
+# Point the scripts at a local fake server (benchmarks/fake_tmdb.py) for tests
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+# Requests per second across the whole run; TMDB allows about 50
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "35"))
+# Requests in flight at once
+TMDB_CONCURRENCY = int(os.getenv("TMDB_CONCURRENCY", "16"))
+TMDB_TIMEOUT_SECONDS = float(os.getenv("TMDB_TIMEOUT_SECONDS", "10"))
+# On-disk response cache; an empty value disables it
+TMDB_CACHE_DIR = os.getenv("TMDB_CACHE_DIR", "tmdb_cache")
+# Cached responses younger than this are used without asking TMDB at all;
+# older ones are revalidated with If-None-Match / If-Modified-Since
+TMDB_CACHE_MAX_AGE_SECONDS = float(os.getenv("TMDB_CACHE_MAX_AGE_SECONDS", "21600"))
+# Entries not stored or revalidated for this long are deleted when a client opens
+TMDB_CACHE_TTL_SECONDS = float(os.getenv("TMDB_CACHE_TTL_SECONDS", str(30 * 86400)))
+# Then the least recently stored ones beyond this count (0 = no cap)
+TMDB_CACHE_MAX_ENTRIES = int(os.getenv("TMDB_CACHE_MAX_ENTRIES", "200000"))
+
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second with bursts of up to
+    `capacity`. Waiters are served in arrival order.
+
+    The rate adapts AIMD-style: `throttle()` (on a 429) halves it, at most
+    once per second since a burst of 429s reports one overload; each
+    `recover()` (on a success) adds back 1% of the configured maximum.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.max_rate = rate
+        self.min_rate = max(rate / 32, 0.5)
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._throttled_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self.updated_at
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self):
+        now = time.monotonic()
+        if now - self._throttled_at >= 1:
+            self._throttled_at = now
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class HttpCache:
+    """
+    TMDB responses on disk, one JSON file per URL (the API key is not part of
+    the key), with the validators needed to revalidate them. `prune()` keeps
+    the directory bounded by age (`ttl`) and entry count (`max_entries`).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_age: float = TMDB_CACHE_MAX_AGE_SECONDS,
+        ttl: float = TMDB_CACHE_TTL_SECONDS,
+        max_entries: int = TMDB_CACHE_MAX_ENTRIES,
+    ):
+        self.directory = directory
+        self.max_age = max_age
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def key(self, path: str, params: dict) -> str:
+        query = urlencode(sorted((k, v) for k, v in params.items() if k != "api_key"))
+        return hashlib.blake2b(f"{path}?{query}".encode(), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small with tens of thousands of movies
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key: str):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.max_age
+
+    def conditional_headers(self, entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key: str, body, headers=None, entry: dict = None):
+        """Saves a 200 response, or (with `entry`) renews one after a 304."""
+        if entry is None:
+            entry = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "body": body,
+            }
+        entry["fetched_at"] = time.time()
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def prune(self) -> int:
+        """
+        Deletes entries not stored or renewed within `ttl`, then the least
+        recently stored ones beyond `max_entries`. Returns how many went.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        # (mtime, path) of every entry; store() rewrites the file, so the
+        # mtime is when it was last fetched or revalidated
+        entries = []
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                entries += [
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in os.scandir(shard.path)
+                    if entry.name.endswith(".json")
+                ]
+        entries.sort()
+
+        cutoff = time.time() - self.ttl
+        expired = sum(1 for mtime, _ in entries if mtime < cutoff)
+        if self.max_entries:
+            expired = max(expired, len(entries) - self.max_entries)
+        for _, path in entries[:expired]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return expired
+
+
+class TmdbClient:
+    """
+    Async TMDB API client shared by every request of a run: one connection
+    pool, one rate limiter, a cap on requests in flight and, when enabled,
+    the on-disk conditional cache.
+    """
+
+    def __init__(
+        self,
+        api_key: str = API_KEY,
+        base_url: str = TMDB_BASE_URL,
+        rate: float = TMDB_RATE_LIMIT,
+        concurrency: int = TMDB_CONCURRENCY,
+        cache_dir: str = TMDB_CACHE_DIR,
+    ):
+        self.api_key = api_key
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=TMDB_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=concurrency),
+        )
+        self.bucket = TokenBucket(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.not_modified = 0
+
+    async def __aenter__(self):
+        if self.cache is not None:
+            pruned = await asyncio.to_thread(self.cache.prune)
+            if pruned:
+                print(f"Pruned {pruned} expired TMDB cache entries")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.aclose()
+
+    def counters(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "cache hits": self.cache_hits,
+            "not modified": self.not_modified,
+        }
+
+    async def get(self, path: str, **params):
+        """
+        GETs `path` (relative to TMDB_BASE_URL) as JSON, or None on a 404.
+        Fresh cached responses skip the network, stale ones are revalidated.
+        Rate limits, server errors and network errors are retried with
+        exponential backoff (or the server's Retry-After).
+        """
+        params = {"api_key": self.api_key, **params}
+        key = entry = None
+        headers = {}
+        if self.cache is not None:
+            key = self.cache.key(path, params)
+            # Cache files are read and written off the event loop
+            entry = await asyncio.to_thread(self.cache.load, key)
+            if entry is not None:
+                if self.cache.is_fresh(entry):
+                    self.cache_hits += 1
+                    return entry["body"]
+                headers = self.cache.conditional_headers(entry)
+
+        for attempt in range(MAX_RETRIES + 1):
+            delay = 2**attempt
+            await self.bucket.acquire()
+            try:
+                async with self.semaphore:
+                    response = await self.http.get(path, params=params, headers=headers)
+                self.requests += 1
+            except httpx.TransportError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                print(f"Retrying {path} in {delay}s: {e!r}")
+            else:
+                if response.status_code == 429:
+                    self.bucket.throttle()
+                if response.status_code == 404:
+                    return None
+                if response.status_code == 304 and entry is not None:
+                    self.bucket.recover()
+                    self.not_modified += 1
+                    await asyncio.to_thread(self.cache.store, key, None, entry=entry)
+                    return entry["body"]
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    self.bucket.recover()
+                    body = response.json()
+                    if self.cache is not None:
+                        await asyncio.to_thread(
+                            self.cache.store, key, body, response.headers
+                        )
+                    return body
+                if attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                delay = retry_after_seconds(response.headers.get("Retry-After"), delay)
+
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+
+def retry_after_seconds(value: str, default: float) -> float:
+    """
+    Wait asked for by a Retry-After header, given either as delta-seconds or
+    as an HTTP-date; `default` when it is missing or unparseable.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def pick_trailer_key(videos: dict) -> str:
+    """YouTube key of the first trailer in a /videos payload, or "N/A"."""
+    return next(
+        (
+            v["key"]
+            for v in (videos or {}).get("results", [])
+            if v["site"] == "YouTube" and v["type"] == "Trailer"
+        ),
+        "N/A",
+    )
+
+
+class Progress:
+    """Named counters of a run, reported with their rates."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.counts = {}
+
+    def add(self, name: str, count: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        rates = [
+            f"{count} {name} ({count / elapsed:.1f}/s)"
+            for name, count in self.counts.items()
+        ]
+        return f"[{elapsed:.1f}s] " + ", ".join(rates)
@@ -0,0 +1,323 @@
+import os
+import re
+import bisect
+import unicodedata
+from array import array
+import numpy as np
+from sqlalchemy.orm import Session
+from models import Movie, Genre
+from embedding_builder import stream_movies
+
+SEARCH_INDEX_FILE = "search_index.npz"
+
+# BM25 term saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A word in the title counts like this many in the overview (BM25F field weight)
+TITLE_WEIGHT = 3.0
+# Added to movies whose whole title is the query, so exact lookups come first
+EXACT_TITLE_BONUS = 1000.0
+# Completions of the last query word, the most common ones first ("star w")
+MAX_PREFIX_EXPANSIONS = 32
+PREFIX_MIN_LENGTH = 2
+# Shortest word that may match a title word one typo away
+TYPO_MIN_LENGTH = 4
+# Completions and typo matches score less than the word itself
+PREFIX_MATCH_WEIGHT = 0.8
+TYPO_MATCH_WEIGHT = 0.6
+# Reciprocal rank fusion constant: the rank at which a hit's weight halves
+RRF_K = 60
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercase words with accents stripped ("Amélie" -> ["amelie"])."""
+    text = unicodedata.normalize("NFKD", text or "").lower()
+    if not text.isascii():
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def _deletes(word: str) -> set:
+    """Every string one character shorter than `word`."""
+    return {word[:i] + word[i + 1 :] for i in range(len(word))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if one insertion, deletion, substitution or swap turns a into b."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return (
+            a[i + 1 :] == b[i + 1 :]
+            or a[i : i + 2] == b[i : i + 2][::-1]
+            and a[i + 2 :] == b[i + 2 :]
+        )
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return shorter[i:] == longer[i + 1 :]
+
+
+class SearchHits:
+    """Movie ids best first; `title_match` if the best one's title has every word."""
+
+    def __init__(self, movie_ids: list, title_match: bool):
+        self.movie_ids = movie_ids
+        self.title_match = title_match
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over movie titles, genres and overviews.
+
+    Postings are stored CSR-style: the postings of term t are
+    `docs[offsets[t]:offsets[t + 1]]`, each with its precomputed BM25 impact
+    (so a query only sums impacts) and whether the word is in the title.
+    Terms are numbered in alphabetical order, which makes prefix completion
+    a binary search. Typos are matched against title words through a
+    symmetric-delete table built at load time.
+    """
+
+    def __init__(
+        self,
+        movie_ids: np.ndarray,
+        vocabulary: list,
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        impacts: np.ndarray,
+        in_title: np.ndarray,
+        titles: list,
+    ):
+        self.movie_ids = movie_ids
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.docs = docs
+        self.impacts = impacts
+        self.in_title = in_title
+        self.titles = titles
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+
+        # Normalized title -> docs, for exact title lookups
+        self.exact_titles = {}
+        for doc, title in enumerate(titles):
+            self.exact_titles.setdefault(title, []).append(doc)
+
+        # Title words only: completions and typos are meant for title lookups
+        title_terms = np.unique(
+            np.searchsorted(offsets, np.flatnonzero(in_title), "right") - 1
+        )
+        self.title_term_ids = title_terms.astype(np.int32)
+        self.title_vocabulary = [vocabulary[t] for t in title_terms]
+        self.document_frequency = np.diff(offsets)
+        self.title_deletes = {}
+        for term_id, term in zip(title_terms.tolist(), self.title_vocabulary):
+            if len(term) >= TYPO_MIN_LENGTH:
+                for variant in _deletes(term):
+                    self.title_deletes.setdefault(variant, []).append(term_id)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @classmethod
+    def build(cls, movies) -> "SearchIndex":
+        """Indexes (movie id, title, other text) tuples, e.g. genres and overview."""
+        term_ids = {}
+        terms, docs, weights = array("i"), array("i"), array("f")
+        flags = array("b")
+        movie_ids, titles = array("i"), []
+
+        for doc, (movie_id, title, body) in enumerate(movies):
+            title_words = tokenize(title)
+            movie_ids.append(movie_id)
+            titles.append(" ".join(title_words))
+
+            counts = {}
+            for word in title_words:
+                term = term_ids.setdefault(word, len(term_ids))
+                counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+            title_terms = set(counts)
+            for word in tokenize(body):
+                term = term_ids.setdefault(word, len(term_ids))
+                counts[term] = counts.get(term, 0) + 1
+            for term, weight in counts.items():
+                terms.append(term)
+                docs.append(doc)
+                weights.append(weight)
+                flags.append(term in title_terms)
+
+        # Renumber terms alphabetically
+        vocabulary = sorted(term_ids)
+        renumber = np.empty(len(term_ids), dtype=np.int32)
+        renumber[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary))
+        terms = renumber[np.frombuffer(terms, dtype=np.int32)]
+        docs = np.frombuffer(docs, dtype=np.int32)
+        tf = np.frombuffer(weights, dtype=np.float32)
+        in_title = np.frombuffer(flags, dtype=np.int8).astype(bool)
+
+        order = np.lexsort((docs, terms))
+        terms, docs, tf, in_title = (
+            terms[order],
+            docs[order],
+            tf[order],
+            in_title[order],
+        )
+        df = np.bincount(terms, minlength=len(vocabulary))
+        offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        n_docs = len(movie_ids)
+        lengths = np.bincount(docs, weights=tf, minlength=n_docs)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1e-9))
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        impacts = (idf[terms] * tf * (BM25_K1 + 1) / (tf + norm[docs])).astype(
+            np.float32
+        )
+
+        return cls(
+            np.frombuffer(movie_ids, dtype=np.int32).copy(),
+            vocabulary,
+            offsets,
+            docs,
+            impacts,
+            in_title,
+            titles,
+        )
+
+    def save(self, directory: str):
+        # Vocabulary and titles as newline-joined UTF-8, no pickles
+        path = os.path.join(directory, SEARCH_INDEX_FILE)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            movie_ids=self.movie_ids,
+            vocabulary=np.frombuffer(
+                "\n".join(self.vocabulary).encode("utf-8"), dtype=np.uint8
+            ),
+            offsets=self.offsets,
+            docs=self.docs,
+            impacts=self.impacts,
+            in_title=self.in_title,
+            titles=np.frombuffer(
+                "\n".join(self.titles).encode("utf-8"), dtype=np.uint8
+            ),
+        )
+        os.replace(tmp_path, path)
+
+    def _expansions(self, word: str, last: bool) -> list:
+        """(term id, weight) pairs a query word matches."""
+        matches = {}
+        term = self.term_ids.get(word)
+        if term is not None:
+            matches[term] = 1.0
+
+        if last and len(word) >= PREFIX_MIN_LENGTH:
+            lo = bisect.bisect_left(self.title_vocabulary, word)
+            hi = bisect.bisect_left(self.title_vocabulary, word + "\uffff")
+            candidates = self.title_term_ids[lo:hi]
+            if len(candidates) > MAX_PREFIX_EXPANSIONS:
+                df = self.document_frequency[candidates]
+                top = np.argpartition(-df, MAX_PREFIX_EXPANSIONS)
+                candidates = candidates[top[:MAX_PREFIX_EXPANSIONS]]
+            for candidate in candidates.tolist():
+                matches.setdefault(candidate, PREFIX_MATCH_WEIGHT)
+
+        if term is None and len(word) >= TYPO_MIN_LENGTH:
+            candidates = set(self.title_deletes.get(word, ()))
+            for variant in _deletes(word):
+                candidates.update(self.title_deletes.get(variant, ()))
+                if variant in self.term_ids:
+                    candidates.add(self.term_ids[variant])
+            for candidate in candidates:
+                if _within_one_edit(word, self.vocabulary[candidate]):
+                    matches.setdefault(candidate, TYPO_MATCH_WEIGHT)
+
+        return list(matches.items())
+
+    def search(self, query: str, k: int) -> SearchHits:
+        """
+        The k best movies for `query` by BM25. The last word also matches as a
+        prefix (search as you type), words of four letters or more also match
+        title words one typo away, and an exact title match ranks first.
+        """
+        words = tokenize(query)
+        if not words or not len(self.movie_ids):
+            return SearchHits([], False)
+
+        scores = np.zeros(len(self.movie_ids), dtype=np.float32)
+        title_words = np.zeros(len(self.movie_ids), dtype=np.int16)
+        for i, word in enumerate(words):
+            # A word counts once per movie, through its best matching term
+            word_scores = np.zeros_like(scores)
+            word_in_title = np.zeros(len(self.movie_ids), dtype=bool)
+            for term, weight in self._expansions(word, last=i == len(words) - 1):
+                start, end = self.offsets[term], self.offsets[term + 1]
+                docs = self.docs[start:end]
+                word_scores[docs] = np.maximum(
+                    word_scores[docs], weight * self.impacts[start:end]
+                )
+                word_in_title[docs[self.in_title[start:end]]] = True
+            scores += word_scores
+            title_words += word_in_title
+
+        exact = self.exact_titles.get(" ".join(words))
+        if exact:
+            scores[exact] += EXACT_TITLE_BONUS
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        title_match = bool(len(hits)) and title_words[hits[0]] == len(words)
+        return SearchHits(self.movie_ids[hits].tolist(), title_match)
+
+
+def _decode_lines(blob: np.ndarray, count: int) -> list:
+    return blob.tobytes().decode("utf-8").split("\n") if count else []
+
+
+def load_search_index(directory: str):
+    """Loads a snapshot's search index, or returns None if it has none."""
+    path = os.path.join(directory, SEARCH_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        offsets, movie_ids = data["offsets"], data["movie_ids"]
+        return SearchIndex(
+            movie_ids,
+            _decode_lines(data["vocabulary"], len(offsets) - 1),
+            offsets,
+            data["docs"],
+            data["impacts"],
+            data["in_title"],
+            _decode_lines(data["titles"], len(movie_ids)),
+        )
+
+
+def build_search_index(db: Session, directory: str) -> SearchIndex:
+    """Indexes the movies table into a snapshot directory, streaming the rows."""
+    genre_map = {g.id: g.name for g in db.query(Genre).all()}
+    rows = stream_movies(db, Movie.id, Movie.title, Movie.genres, Movie.overview)
+    index = SearchIndex.build(
+        (
+            row.id,
+            row.title,
+            " ".join([genre_map.get(gid, "") for gid in (row.genres or [])])
+            + " "
+            + (row.overview or ""),
+        )
+        for row in rows
+    )
+    index.save(directory)
+    print(f"Search index built for {len(index)} movies")
+    return index
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """Merges several best-first id lists; each id scores sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, movie_id in enumerate(ranking):
+            scores[movie_id] = scores.get(movie_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
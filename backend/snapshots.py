@@ -0,0 +1,252 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from embedding_store import load_store
+from vector_index import load_or_build_index
+from neighbor_table import build_neighbor_table, load_neighbor_table
+from search_index import load_search_index
+from movie_attributes import load_movie_attributes
+
+SNAPSHOT_ROOT = os.getenv("EMBEDDING_SNAPSHOT_DIR", "embedding_snapshots")
+VECTOR_INDEX_FILE = "movie_index.npz"
+# Pointer files naming the live and the rollback snapshot
+CURRENT_FILE = "CURRENT"
+PREVIOUS_FILE = "PREVIOUS"
+# Held while a process builds or migrates a snapshot, so uvicorn workers
+# starting together build it once
+BUILD_LOCK_FILE = ".build.lock"
+# How often each worker checks whether another one published a new snapshot
+# (0 disables the check)
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "5"))
+
+
+class IndexSnapshot:
+    """
+    Everything a ranking request reads, bundled so it is always consistent.
+
+    A snapshot is never modified after it is built: a rebuild makes a new one
+    and publishes it with a single reference swap. Requests grab
+    `snapshots.current` once and use it throughout, so they never mix a new
+    matrix with old ids; an old snapshot is released when its last reader
+    drops the reference.
+    """
+
+    __slots__ = (
+        "version",
+        "directory",
+        "store",
+        "index",
+        "neighbors",
+        "search",
+        "attributes",
+    )
+
+    def __init__(
+        self,
+        version: str,
+        directory: str,
+        store,
+        index,
+        neighbors=None,
+        search=None,
+        attributes=None,
+    ):
+        self.version = version
+        self.directory = directory
+        self.store = store
+        self.index = index
+        # Precomputed top-K table (neighbor_table.py); None means score live
+        self.neighbors = neighbors
+        # Lexical title/overview index (search_index.py), built from the same
+        # catalog as the embeddings; None until one is built for this snapshot
+        self.search = search
+        # Filterable metadata columns in row order (movie_attributes.py)
+        self.attributes = attributes
+
+    def similar_rows(self, row: int, k: int, exclude=None):
+        """
+        The k rows most similar to `row` (never `row` itself), minus `exclude`.
+        Read from the neighbour table when it can answer, scored live otherwise.
+        """
+        if self.neighbors is not None:
+            rows = self.neighbors.lookup(row, k, exclude)
+            if rows is not None:
+                return rows
+
+        skip = [row] if exclude is None else [row, *exclude]
+        rows, _ = self.index.search(self.store.embeddings[row], k, exclude=skip)
+        return rows
+
+    def similar_rows_batch(self, rows, k: int, exclude=None):
+        """
+        similar_rows for several seed rows at once; seeds never appear in any
+        result. Rows the neighbour table cannot answer are scored together
+        with one batched search.
+        """
+        skip = list(rows) if exclude is None else [*rows, *exclude]
+        results = {}
+        if self.neighbors is not None:
+            for row in rows:
+                found = self.neighbors.lookup(row, k, skip)
+                if found is not None:
+                    results[row] = found
+
+        missing = [row for row in rows if row not in results]
+        if missing:
+            found, _ = self.index.search_batch(
+                self.store.embeddings[missing], k, exclude=skip
+            )
+            results.update(zip(missing, found))
+
+        return [results[row] for row in rows]
+
+
+class SnapshotManager:
+    """
+    Versioned snapshot directories under SNAPSHOT_ROOT plus the published one.
+
+    The live and the previous version are kept on disk, so a rollback is just
+    a re-publish of the previous directory.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_ROOT):
+        self.root = root
+        self.current = None
+        self._lock = threading.Lock()
+
+    def new_directory(self):
+        """Reserves a (version, directory) pair for a snapshot being built."""
+        version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        directory = os.path.join(self.root, version)
+        os.makedirs(directory)
+        return version, directory
+
+    def discard(self, directory: str):
+        """Deletes a directory from new_directory that will not be published."""
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def load(self, version: str):
+        """Opens a snapshot from disk, or returns None if it is incomplete."""
+        directory = os.path.join(self.root, version)
+        store = load_store(directory)
+        if store is None:
+            return None
+        return self.build(version, directory, store, compute_neighbors=False)
+
+    def build(self, version: str, directory: str, store, compute_neighbors=True):
+        """
+        Wraps a freshly written store into a snapshot with its vector index,
+        its search index and attribute columns if they were saved and, unless
+        already on disk, its precomputed neighbour table.
+        """
+        index = load_or_build_index(
+            store.embeddings, os.path.join(directory, VECTOR_INDEX_FILE)
+        )
+        neighbors = load_neighbor_table(directory)
+        if neighbors is None and compute_neighbors:
+            neighbors = build_neighbor_table(directory, store.embeddings, index)
+        search = load_search_index(directory)
+        attributes = load_movie_attributes(directory)
+        return IndexSnapshot(
+            version, directory, store, index, neighbors, search, attributes
+        )
+
+    @contextmanager
+    def build_lock(self):
+        """
+        Exclusive lock across processes sharing SNAPSHOT_ROOT. A no-op where
+        fcntl is unavailable (Windows), where only one worker runs anyway.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, BUILD_LOCK_FILE), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """
+        Switches to the snapshot CURRENT points to if another process published
+        it. Returns the new snapshot, or None if nothing changed.
+        """
+        version = self._read_pointer(CURRENT_FILE)
+        if not version or (self.current and self.current.version == version):
+            return None
+        snapshot = self.load(version)
+        if snapshot is None:
+            return None
+        with self._lock:
+            # This process may have published it meanwhile
+            if self.current and self.current.version == version:
+                return None
+            self.current = snapshot
+        print(f"Switched to embedding snapshot {version}")
+        return snapshot
+
+    def load_current(self):
+        """Opens the snapshot CURRENT points to, without publishing it."""
+        version = self._read_pointer(CURRENT_FILE)
+        return self.load(version) if version else None
+
+    def publish(self, snapshot: IndexSnapshot):
+        """Makes `snapshot` the live one, on disk and for new requests."""
+        with self._lock:
+            live = self._read_pointer(CURRENT_FILE)
+            if live and live != snapshot.version:
+                self._write_pointer(PREVIOUS_FILE, live)
+            self._write_pointer(CURRENT_FILE, snapshot.version)
+            # The single reference swap readers observe
+            self.current = snapshot
+            self._prune()
+        print(f"Published embedding snapshot {snapshot.version}")
+
+    def rollback(self):
+        """
+        Re-publishes the previous snapshot; returns it, or None if there is none.
+        Waits for a build in progress, which would otherwise publish over it.
+        """
+        with self.build_lock():
+            version = self._read_pointer(PREVIOUS_FILE)
+            snapshot = self.load(version) if version else None
+            if snapshot is not None:
+                self.publish(snapshot)
+        return snapshot
+
+    def info(self) -> dict:
+        return {
+            "current": self.current.version if self.current else None,
+            "previous": self._read_pointer(PREVIOUS_FILE),
+        }
+
+    def _prune(self):
+        # Keep live and previous; anything newer may be a build in progress
+        keep = {self._read_pointer(CURRENT_FILE), self._read_pointer(PREVIOUS_FILE)}
+        oldest_kept = min(v for v in keep if v)
+        for version in os.listdir(self.root):
+            path = os.path.join(self.root, version)
+            if os.path.isdir(path) and version not in keep and version < oldest_kept:
+                # Fails harmlessly (and is retried next publish) while still mapped
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _read_pointer(self, name: str):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+
+    def _write_pointer(self, name: str, version: str):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, path)
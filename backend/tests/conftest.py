@@ -0,0 +1,12 @@
+import os
+import sys
+
+# database.py reads these at import; no connection is opened by the tests
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_NAME", "movies_test")
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASS", "test")
+# The remote encoder connects lazily, so importing main loads no model
+os.environ.setdefault("ENCODER_BACKEND", "remote")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+torch = pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from encoders import OnnxEncoder, SentenceTransformerEncoder, export_onnx
+
+WORDS = (
+    "[PAD] [UNK] [CLS] [SEP] [MASK] a the movie dark thriller feel good comedy "
+    "space sci fi from 90s love drama horror cabin family heist"
+).split()
+QUERIES = [
+    "feel good comedy",
+    "dark thriller from the 90s",
+    "a movie",
+    "space sci fi love drama horror cabin family heist",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    """A small random BERT wrapped as a sentence-transformers model, exported to ONNX."""
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from sentence_transformers import SentenceTransformer, models
+
+    root = tmp_path_factory.mktemp("encoder")
+    hf_dir, st_dir, onnx_dir = root / "hf", root / "st", root / "onnx"
+    hf_dir.mkdir()
+    (hf_dir / "vocab.txt").write_text("\n".join(WORDS))
+    BertTokenizerFast(str(hf_dir / "vocab.txt")).save_pretrained(hf_dir)
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(WORDS),
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+    )
+    BertModel(config).save_pretrained(hf_dir)
+    transformer = models.Transformer(str(hf_dir), max_seq_length=64)
+    SentenceTransformer(
+        modules=[transformer, models.Pooling(64, "mean"), models.Normalize()]
+    ).save(str(st_dir))
+
+    export_onnx(str(st_dir), str(onnx_dir))
+    reference = SentenceTransformerEncoder(str(st_dir)).encode(QUERIES)
+    return onnx_dir, reference
+
+
+def test_fp32_matches_pytorch(exported):
+    onnx_dir, reference = exported
+    # Batches of 2 so padding differs from the reference's single batch
+    vectors = OnnxEncoder(str(onnx_dir), "fp32").encode(QUERIES, batch_size=2)
+    assert vectors.shape == reference.shape
+    np.testing.assert_allclose(vectors, reference, atol=1e-4)
+
+
+def test_int8_stays_close_to_pytorch(exported):
+    onnx_dir, reference = exported
+    vectors = OnnxEncoder(str(onnx_dir), "int8").encode(QUERIES)
+    assert vectors.shape == reference.shape
+    # Rows are normalized, so the row-wise dot product is the cosine
+    assert np.min(np.sum(vectors * reference, axis=1)) > 0.98
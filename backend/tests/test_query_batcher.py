@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from query_batcher import QueryBatcher, BatcherStoppedError
+
+
+def test_stop_fails_waiting_queries():
+    release = threading.Event()
+
+    def slow_batch(texts):
+        release.wait(5)
+        return [text.upper() for text in texts]
+
+    async def run():
+        batcher = QueryBatcher(slow_batch, window_ms=1, max_batch=1)
+        await batcher.start()
+        # The first query is being processed, the other two wait in the queue
+        waiting = [asyncio.create_task(batcher.submit(t)) for t in ("a", "b", "c")]
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        release.set()
+        return await asyncio.gather(*waiting, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(results) == 3
+    for result in results:
+        assert isinstance(result, BatcherStoppedError)
+
+
+def test_submit_after_stop_runs_inline():
+    async def run():
+        batcher = QueryBatcher(lambda texts: [t.upper() for t in texts])
+        await batcher.start()
+        await batcher.stop()
+        return await batcher.submit("a")
+
+    assert asyncio.run(run()) == "A"
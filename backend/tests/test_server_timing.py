@@ -0,0 +1,70 @@
+import asyncio
+import types
+import httpx
+import numpy as np
+import main
+from database import get_async_db
+from embedding_store import EmbeddingStore
+from vector_index import BruteForceIndex, normalize_rows
+
+DIMENSIONS = 8
+
+
+class FakeEncoder:
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False):
+        rng = np.random.default_rng(len(texts))
+        return normalize_rows(rng.standard_normal((len(texts), DIMENSIONS)))
+
+
+async def no_db():
+    yield None
+
+
+async def no_movies(db, movie_ids):
+    return []
+
+
+def server_timing_stages(header: str) -> set:
+    return {entry.split(";")[0].strip() for entry in header.split(",")}
+
+
+def test_cache_miss_reports_batch_stages(monkeypatch):
+    embeddings = normalize_rows(
+        np.random.default_rng(0).standard_normal((50, DIMENSIONS))
+    )
+    snapshot = types.SimpleNamespace(
+        version="test",
+        store=EmbeddingStore(embeddings, np.arange(1, 51, dtype=np.int32)),
+        index=BruteForceIndex(embeddings),
+    )
+    monkeypatch.setattr(main, "model", FakeEncoder())
+    monkeypatch.setattr(main.snapshots, "current", snapshot)
+    monkeypatch.setattr(main, "fetch_movies_in_order", no_movies)
+    monkeypatch.setitem(main.app.dependency_overrides, get_async_db, no_db)
+    main.query_cache.clear()
+
+    async def run():
+        # The lifespan does not run under ASGITransport: start the worker here
+        await main.query_batcher.start()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                miss = await client.get(
+                    "/movies/ai-recommend", params={"query": "space opera"}
+                )
+                hit = await client.get(
+                    "/movies/ai-recommend", params={"query": "space opera"}
+                )
+        finally:
+            await main.query_batcher.stop()
+        return miss, hit
+
+    miss, hit = asyncio.run(run())
+    assert miss.status_code == 200
+    assert {"rank", "encode", "vector_search"} <= server_timing_stages(
+        miss.headers["server-timing"]
+    )
+    # Served from the query cache: no encoder or index stages
+    assert "encode" not in server_timing_stages(hit.headers["server-timing"])
@@ -0,0 +1,266 @@
+import os
+import numpy as np
+from ranking import top_k
+
+# Indexes score with plain dot products, so they expect L2-normalized rows
+# (embedding_store writes the matrix that way) and never copy the matrix.
+
+# Index selection and recall/latency knobs
+# VECTOR_INDEX: "auto" (IVF once the catalog is large enough), "ivf" or "brute"
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "auto")
+# Catalog size from which "auto" switches from the exact scan to IVF
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "20000"))
+# Number of clusters (0 = derive from the catalog size)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+# Clusters scanned per query: higher means better recall, slower queries
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", "10"))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    Returns an L2-normalized float32 copy so a dot product equals cosine similarity.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class BruteForceIndex:
+    """
+    Exact search: scores the query against every row of the matrix.
+    """
+
+    kind = "brute"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, query: np.ndarray, k: int, exclude=None, boost=None):
+        """
+        Returns (row indices, scores) of the k nearest rows.
+        `exclude` is a boolean row mask or a sequence of rows to skip;
+        `boost` is an optional per-row bonus added to the cosine scores.
+        """
+        query = normalize_rows(query.reshape(-1))
+        scores = self.embeddings @ query
+        if boost is not None:
+            scores += boost
+        top = top_k(scores, k, exclude)
+        return top, scores[top]
+
+    def search_batch(self, queries: np.ndarray, k: int, exclude=None, boost=None):
+        """
+        Scores a batch of queries with one matrix-matrix product.
+        Returns per-query lists of (row indices, scores); `exclude` and
+        `boost` apply to every query.
+        """
+        scores = normalize_rows(queries) @ self.embeddings.T
+        if boost is not None:
+            scores += boost
+        tops = [top_k(row, k, exclude) for row in scores]
+        return tops, [row[top] for row, top in zip(scores, tops)]
+
+    def save(self, path: str):
+        np.savez(path, kind=self.kind)
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray):
+        return cls(embeddings)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and a query
+    only scores the rows of its `nprobe` closest clusters.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, embeddings: np.ndarray, centroids, order, offsets, nprobe=None):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        # Row indices grouped by cluster; cluster c owns order[offsets[c]:offsets[c + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe or IVF_NPROBE
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist=None, nprobe=None, seed=0):
+        vectors = embeddings
+        n_rows = len(vectors)
+        nlist = nlist or IVF_NLIST or max(1, int(4 * np.sqrt(n_rows)))
+        nlist = min(nlist, n_rows)
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; 64 points per cluster is plenty for stable centroids
+        sample_size = min(n_rows, nlist * 64)
+        sample = vectors[rng.choice(n_rows, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            # Empty clusters keep their previous centroid
+            filled = np.bincount(assignment, minlength=nlist) > 0
+            centroids[filled] = sums[filled]
+            centroids = normalize_rows(centroids)
+
+        assignment = cls._assign(vectors, centroids)
+        order = np.argsort(assignment, kind="stable").astype(np.int32)
+        counts = np.bincount(assignment, minlength=nlist)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return cls(vectors, centroids, order, offsets, nprobe=nprobe)
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=65536):
+        # Chunked so the (rows x clusters) score matrix stays small
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            block = vectors[start : start + chunk_size]
+            assignment[start : start + len(block)] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        return assignment
+
+    def search(self, query: np.ndarray, k: int, exclude=None, nprobe=None, boost=None):
+        """
+        Returns (row indices, scores) of the approximate k nearest rows.
+        `exclude` is a boolean row mask or a sequence of rows to skip;
+        `boost` is an optional per-row bonus added to the cosine scores.
+
+        When a mask leaves fewer than k rows in the probed clusters (a
+        selective metadata filter), the rows it allows are scored exactly.
+        """
+        query = normalize_rows(query.reshape(-1))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        probe = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate(
+            [self.order[self.offsets[c] : self.offsets[c + 1]] for c in probe]
+        )
+        scores = self.embeddings[candidates] @ query
+        if boost is not None:
+            scores += boost[candidates]
+        mask = None
+        if exclude is not None:
+            exclude = np.asarray(exclude)
+            if exclude.dtype == bool:
+                mask, exclude = exclude, exclude[candidates]
+            else:
+                exclude = np.isin(candidates, exclude)
+        top = top_k(scores, k, exclude)
+
+        if mask is not None and len(top) < k:
+            allowed = np.flatnonzero(~mask)
+            scores = self.embeddings[allowed] @ query
+            if boost is not None:
+                scores += boost[allowed]
+            top = top_k(scores, k)
+            return allowed[top], scores[top]
+        return candidates[top], scores[top]
+
+    def search_batch(self, queries: np.ndarray, k: int, exclude=None, boost=None):
+        """
+        Per-query lists of (row indices, scores); each query probes its own
+        clusters. `exclude` and `boost` apply to every query.
+
+        Queries are grouped by probed cluster, so each cluster's rows are
+        scored against all of its queries with one matrix product.
+        """
+        if exclude is not None:
+            # A mask may need the exact fallback of search()
+            results = [self.search(q, k, exclude, boost=boost) for q in queries]
+            return [rows for rows, _ in results], [scores for _, scores in results]
+
+        queries = normalize_rows(queries)
+        nprobe = min(self.nprobe, self.nlist)
+        probes = np.argpartition(queries @ self.centroids.T, -nprobe, axis=1)
+        probes = probes[:, -nprobe:].ravel()
+        # (cluster, query) pairs sorted by cluster
+        probing = np.repeat(np.arange(len(queries)), nprobe)
+        order = np.argsort(probes, kind="stable")
+        probes, probing = probes[order], probing[order]
+        clusters, starts = np.unique(probes, return_index=True)
+
+        candidates = [[] for _ in range(len(queries))]
+        candidate_scores = [[] for _ in range(len(queries))]
+        for cluster, members in zip(clusters, np.split(probing, starts[1:])):
+            rows = self.order[self.offsets[cluster] : self.offsets[cluster + 1]]
+            if not len(rows):
+                continue
+            block = queries[members] @ self.embeddings[rows].T
+            if boost is not None:
+                block += boost[rows]
+            for query, scores in zip(members, block):
+                candidates[query].append(rows)
+                candidate_scores[query].append(scores)
+
+        tops, top_scores = [], []
+        for rows, scores in zip(candidates, candidate_scores):
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+            scores = np.concatenate(scores) if scores else np.empty(0, np.float32)
+            top = top_k(scores, k)
+            tops.append(rows[top])
+            top_scores.append(scores[top])
+        return tops, top_scores
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            kind=self.kind,
+            centroids=self.centroids,
+            order=self.order,
+            offsets=self.offsets,
+        )
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray):
+        data = np.load(path)
+        return cls(embeddings, data["centroids"], data["order"], data["offsets"])
+
+
+INDEX_TYPES = {BruteForceIndex.kind: BruteForceIndex, IVFIndex.kind: IVFIndex}
+
+
+def build_index(embeddings: np.ndarray, kind: str = None):
+    """Builds the configured index type for the given embedding matrix."""
+    kind = kind or VECTOR_INDEX
+    if kind == "auto":
+        kind = "ivf" if len(embeddings) >= IVF_MIN_ROWS else "brute"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    if kind == IVFIndex.kind:
+        return IVFIndex.build(embeddings)
+    return BruteForceIndex(embeddings)
+
+
+def load_or_build_index(embeddings: np.ndarray, path: str):
+    """
+    Loads a persisted index if it matches the embeddings, otherwise builds and saves one.
+    """
+    if os.path.exists(path):
+        data = np.load(path)
+        kind = str(data["kind"])
+        configured = VECTOR_INDEX in ("auto", kind)
+        matches = "order" not in data or len(data["order"]) == len(embeddings)
+        if kind in INDEX_TYPES and configured and matches:
+            print(f"Loading cached {kind} vector index...")
+            return INDEX_TYPES[kind].load(path, embeddings)
+
+    index = build_index(embeddings)
+    index.save(path)
+    print(f"Built {index.kind} vector index over {len(index)} movies")
+    return index
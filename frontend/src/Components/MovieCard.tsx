@@ -34,16 +34,18 @@ export default function MovieCard({
   const checkFavoriteStatus = async () => {
     try {
       const token = localStorage.getItem("token");
-      const response = await fetch("http://localhost:8000/movies/favorites", {
-        headers: {
-          Authorization: `Bearer ${token}`,
-        },
-      });
+      const response = await fetch(
+        `http://localhost:8000/movies/favorite/${movie.id}`,
+        {
+          headers: {
+            Authorization: `Bearer ${token}`,
+          },
+        }
+      );
 
       if (response.ok) {
         const data = await response.json();
-        const isFav = data.favorites.some((fav: Movie) => fav.id === movie.id);
-        setIsFavorite(isFav);
+        setIsFavorite(data.favorited);
       }
     } catch (error) {
       console.error("Error checking favorite status:", error);
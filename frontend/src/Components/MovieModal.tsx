@@ -54,6 +54,16 @@ export default function MovieModal({
         document.body.style.paddingRight = `${scrollBarWidth}px`;
       }
 
+      // Cards carry no overview, backdrop or trailer: load the full movie
+      fetch(`http://localhost:8000/movies/${activeMovie.id}`)
+        .then((res) => res.json())
+        .then((detail: Movie) => {
+          setActiveMovie((current) =>
+            current.id === detail.id ? { ...current, ...detail } : current
+          );
+        })
+        .catch((err) => console.error("Error fetching movie details:", err));
+
       // 2. Fetch recommendations using the object-safe key 'similar_movies'
       fetch(`http://localhost:8000/movies/similar/${activeMovie.id}`)
         .then((res) => res.json())
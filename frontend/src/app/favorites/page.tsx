@@ -10,6 +10,10 @@ import { Heart } from "lucide-react";
 export default function FavoritesPage() {
   const router = useRouter();
   const [favorites, setFavorites] = useState<Movie[]>([]);
+  const [favoritesCount, setFavoritesCount] = useState(0);
+  // Cursor of the next page of favorites; null once everything is loaded
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [isLoggedIn, setIsLoggedIn] = useState(false);
 
@@ -21,9 +25,30 @@ export default function FavoritesPage() {
     }
     setIsLoggedIn(true);
     fetchFavorites();
+    fetchFavoritesCount();
   }, [router]);
 
-  const fetchFavorites = async () => {
+  const fetchFavoritesCount = async () => {
+    try {
+      const token = localStorage.getItem("token");
+      const response = await fetch(
+        "http://localhost:8000/movies/favorites/count",
+        {
+          headers: {
+            Authorization: `Bearer ${token}`,
+          },
+        }
+      );
+      if (response.ok) {
+        const data = await response.json();
+        setFavoritesCount(data.count);
+      }
+    } catch (error) {
+      console.error("Error fetching favorites count:", error);
+    }
+  };
+
+  const fetchFavorites = async (cursor: number | null = null) => {
     try {
       const token = localStorage.getItem("token");
       console.log(
@@ -31,7 +56,10 @@ export default function FavoritesPage() {
         token ? "exists" : "missing"
       );
 
-      const response = await fetch("http://localhost:8000/movies/favorites", {
+      const url = cursor
+        ? `http://localhost:8000/movies/favorites?cursor=${cursor}`
+        : "http://localhost:8000/movies/favorites";
+      const response = await fetch(url, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
@@ -42,7 +70,9 @@ export default function FavoritesPage() {
       if (response.ok) {
         const data = await response.json();
         console.log("Favorites data:", data);
-        setFavorites(data.favorites || []);
+        const page: Movie[] = data.favorites || [];
+        setFavorites((prev) => (cursor ? [...prev, ...page] : page));
+        setNextCursor(data.next_cursor ?? null);
       } else if (response.status === 401) {
         console.log("Unauthorized - redirecting to login");
         router.push("/login");
@@ -57,6 +87,12 @@ export default function FavoritesPage() {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    await fetchFavorites(nextCursor);
+    setLoadingMore(false);
+  };
+
   if (!isLoggedIn) {
     return null;
   }
@@ -70,7 +106,7 @@ export default function FavoritesPage() {
         <div className="mb-8">
           <h1 className="text-3xl font-bold mb-2">My Favorites</h1>
           <p className="text-zinc-400 text-sm">
-            {favorites.length} {favorites.length === 1 ? "movie" : "movies"}{" "}
+            {favoritesCount} {favoritesCount === 1 ? "movie" : "movies"}{" "}
             saved
           </p>
         </div>
@@ -101,11 +137,24 @@ export default function FavoritesPage() {
             </button>
           </div>
         ) : (
-          <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 lg:grid-cols-5 gap-6">
-            {favorites.map((movie) => (
-              <MovieCard key={movie.id} movie={movie} />
-            ))}
-          </div>
+          <>
+            <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 lg:grid-cols-5 gap-6">
+              {favorites.map((movie) => (
+                <MovieCard key={movie.id} movie={movie} />
+              ))}
+            </div>
+            {nextCursor !== null && (
+              <div className="flex justify-center mt-10">
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="px-6 py-3 bg-brand-surface rounded-full font-bold hover:scale-105 transition-transform disabled:opacity-50"
+                >
+                  {loadingMore ? "Loading..." : "Load more"}
+                </button>
+              </div>
+            )}
+          </>
         )}
       </div>
     </main>
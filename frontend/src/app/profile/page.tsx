@@ -44,7 +44,7 @@ export default function ProfilePage() {
 
       // Fetch favorites count
       const favResponse = await fetch(
-        "http://localhost:8000/movies/favorites",
+        "http://localhost:8000/movies/favorites/count",
         {
           headers: { Authorization: `Bearer ${token}` },
         }
@@ -52,7 +52,7 @@ export default function ProfilePage() {
 
       if (favResponse.ok) {
         const data = await favResponse.json();
-        setFavoritesCount(data.favorites?.length || 0);
+        setFavoritesCount(data.count || 0);
       }
 
       // Decode JWT to get email (simple decode, not verification)